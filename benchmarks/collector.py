@@ -0,0 +1,57 @@
+"""
+Measures the overhead the collector adds to each traced query.
+
+    python -m benchmarks.collector --tests 200 --queries-per-test 50
+"""
+
+import argparse
+import tempfile
+import time
+
+from sqlcritic.collector import Collector
+
+CONFIGURATIONS = {
+    "simple": {},
+    "batch": {"batch": True},
+    "batch+filtered": {
+        "batch": True,
+        "db_and_tests_only": True,
+        "tests_only": True,
+        "max_repeats": 2,
+    },
+}
+
+
+def run(collector: Collector, tests: int, queries_per_test: int) -> float:
+    start = time.perf_counter()
+    for test in range(tests):
+        with collector.trace_test("example.py", test, f"test_{test}"):
+            with collector.tracer.start_as_current_span("request"):
+                for query in range(queries_per_test):
+                    with collector.tracer.start_as_current_span("SELECT") as span:
+                        span.set_attribute(
+                            "db.statement", f"select * from foo_{query % 5};"
+                        )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tests", type=int, default=200)
+    parser.add_argument("--queries-per-test", type=int, default=50)
+    parser.add_argument("--stream", action="store_true", help="stream spans to disk")
+    args = parser.parse_args()
+
+    queries = args.tests * args.queries_per_test
+    print(f"queries: {queries}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, options in CONFIGURATIONS.items():
+            stream_path = f"{directory}/{name}.ndjson" if args.stream else None
+            collector = Collector(stream_path=stream_path, **options)
+            seconds = run(collector, args.tests, args.queries_per_test)
+            collector.processor.shutdown()
+            print(f"{name:<16} {seconds:8.3f}s {seconds / queries * 1e6:8.1f}us/query")
+
+
+if __name__ == "__main__":
+    main()
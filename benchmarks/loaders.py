@@ -0,0 +1,51 @@
+"""
+Compares loading collector output from the JSON and compact formats.
+
+    python -m benchmarks.loaders --tests 2000 --queries-per-test 50
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_spans
+from sqlcritic.compact import compact
+from sqlcritic.trace import parse_spans
+from sqlcritic.utils import load_data
+
+
+def _time_load(path: str) -> float:
+    start = time.perf_counter()
+    parse_spans(load_data(path))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tests", type=int, default=1000)
+    parser.add_argument("--queries-per-test", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = generate_spans(tests=args.tests, queries_per_test=args.queries_per_test)
+    print(f"spans: {len(data)}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        json_path = os.path.join(tmpdir, "results.json")
+        compact_path = os.path.join(tmpdir, "results.compact.json")
+        with open(json_path, "w") as f:
+            json.dump(data, f)
+        with open(compact_path, "w") as f:
+            json.dump(compact(data), f)
+
+        for label, path in [("json", json_path), ("compact", compact_path)]:
+            elapsed = min(_time_load(path) for _ in range(args.repeat))
+            size = os.path.getsize(path) / 1024 / 1024
+            rate = len(data) / elapsed
+            print(f"{label:>8}: {size:8.1f} MiB {elapsed:8.3f}s {rate:12.0f} spans/s")
+
+
+if __name__ == "__main__":
+    main()
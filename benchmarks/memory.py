@@ -0,0 +1,46 @@
+"""
+Measures the memory retained by loaded spans.
+
+    python -m benchmarks.memory --tests 2000
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+
+from benchmarks.synthetic import generate_spans
+from sqlcritic.trace import parse_spans
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tests", type=int, default=1000)
+    parser.add_argument("--queries-per-test", type=int, default=20)
+    args = parser.parse_args()
+
+    # round trip through JSON so nothing is shared with the generator
+    encoded = json.dumps(
+        generate_spans(tests=args.tests, queries_per_test=args.queries_per_test)
+    )
+
+    gc.collect()
+    tracemalloc.start()
+    data = json.loads(encoded)
+    spans = parse_spans(data)
+    _, peak = tracemalloc.get_traced_memory()
+    del data
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = len(spans.index)
+    print(f"spans: {count}")
+    print(f"    peak: {peak / 1024 / 1024:8.1f} MiB")
+    print(
+        f"retained: {retained / 1024 / 1024:8.1f} MiB ({retained / count:.0f} B/span)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Measures how analysis scales with the number of worker processes.
+
+    python -m benchmarks.parallel --tests 2000 --workers 1 2 4 8
+"""
+
+import argparse
+import time
+
+from benchmarks.synthetic import generate_metadata, generate_spans
+from sqlcritic.analyze import analyze
+from sqlcritic.trace import parse_spans
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tests", type=int, default=1000)
+    parser.add_argument("--queries-per-test", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    spans = parse_spans(
+        generate_spans(tests=args.tests, queries_per_test=args.queries_per_test)
+    )
+    metadata = generate_metadata()
+    print(f"spans: {len(spans)}")
+
+    baseline = None
+    expected = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        results = list(analyze(spans, metadata=metadata, workers=workers))
+        elapsed = time.perf_counter() - start
+
+        if expected is None:
+            expected = results
+        assert results == expected, "parallel results differ"
+
+        baseline = baseline or elapsed
+        rate = len(spans) / elapsed
+        print(
+            f"workers={workers:<3} {elapsed:8.3f}s {rate:12.0f} spans/s "
+            f"({baseline / elapsed:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Measures the throughput and peak memory of each stage of an action run.
+
+    python -m benchmarks.stages --tests 2000 --n-plus-one 0.1 --distinct-sql 500
+    python -m benchmarks.stages --output baseline.json
+    python -m benchmarks.stages --baseline baseline.json --tolerance 0.2
+"""
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.synthetic import generate_metadata, generate_spans
+from sqlcritic.analyze import analyze
+from sqlcritic.comparison import Comparison
+from sqlcritic.normalize import normalize_sql
+from sqlcritic.notify import GitHubNotifier
+from sqlcritic.parsing import query_cache
+from sqlcritic.storage import Storage
+from sqlcritic.trace import Spans, parse_spans
+
+
+class MemoryStorage(Storage):
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.data.get(key)
+
+    def put(self, key: str, data: Any):
+        self.data[key] = data
+
+
+class BenchmarkPull:
+    number = 1
+    base_sha = "base"
+    head_sha = "head"
+
+
+def measure(fn: Callable[[], Any]) -> Dict[str, float]:
+    """
+    Times the given function and then runs it again to measure its peak memory
+    (tracing allocations slows it down too much to do both at once).
+    """
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"seconds": seconds, "peak_mib": peak / 1024 / 1024}
+
+
+def cold(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """
+    Runs the given function without the queries parsed (or normalized) by earlier
+    runs, so that every measured run parses them as the action does.
+    """
+
+    def run():
+        query_cache.clear()
+        normalize_sql.cache_clear()
+        return fn()
+
+    return run
+
+
+def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    options = dict(
+        tests=args.tests,
+        queries_per_test=args.queries_per_test,
+        n_plus_one=args.n_plus_one,
+        distinct_sql=args.distinct_sql,
+        tables=args.tables,
+    )
+    head_data = generate_spans(seed=0, **options)
+    base_data = generate_spans(seed=1, **options)
+    metadata = generate_metadata(tables=args.tables, indexes=args.indexes)
+
+    spans = parse_spans(head_data)
+    results = list(analyze(spans, metadata=metadata))
+    count = len(spans)
+
+    def analyze_head():
+        # a new `Spans` so the span order (and tests) aren't already cached on it
+        return list(analyze(Spans(spans.index.values()), metadata=metadata))
+
+    def compare():
+        comparison = Comparison(
+            storage=MemoryStorage({"base/spans": base_data, "base/metadata": metadata}),
+            base_sha="base",
+            head_sha="head",
+            # as in the action, the head has already been analyzed
+            head_analysis_results=results,
+        )
+        return list(comparison.new_analysis_results())
+
+    notifier = GitHubNotifier(BenchmarkPull())  # type: ignore
+    # each stage with the number (and kind) of items it processes
+    stages = {
+        "parse_spans": (lambda: parse_spans(head_data), count, "spans"),
+        "analyze": (cold(analyze_head), count, "spans"),
+        # analyzes the base (the head results from `analyze` above are reused)
+        "new_analysis_results": (cold(compare), count, "spans"),
+        "format": (lambda: notifier.format(iter(results)), len(results), "results"),
+    }
+
+    report = {}
+    print(f"spans: {count}  results: {len(results)}")
+    for name, (fn, items, unit) in stages.items():
+        stats = measure(fn)
+        stats["per_second"] = items / stats["seconds"]
+        report[name] = stats
+        print(
+            f"{name:<22} {stats['seconds']:8.3f}s "
+            f"{stats['per_second']:12.0f} {unit + '/s':<10}"
+            f"{stats['peak_mib']:8.1f} MiB peak"
+        )
+    return report
+
+
+def regressions(
+    report: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """
+    Returns a description of each stage that is slower (or uses more memory)
+    than the baseline by more than the given fraction.
+    """
+    failures = []
+    for name, stats in report.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if stats["per_second"] < expected["per_second"] * (1 - tolerance):
+            failures.append(
+                f"{name}: {stats['per_second']:.0f}/s "
+                f"(baseline {expected['per_second']:.0f}/s)"
+            )
+        if stats["peak_mib"] > expected["peak_mib"] * (1 + tolerance):
+            failures.append(
+                f"{name}: {stats['peak_mib']:.1f} MiB peak "
+                f"(baseline {expected['peak_mib']:.1f})"
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tests", type=int, default=1000)
+    parser.add_argument("--queries-per-test", type=int, default=20)
+    parser.add_argument(
+        "--n-plus-one", type=float, default=0.05, help="fraction of tests with an N+1"
+    )
+    parser.add_argument("--distinct-sql", type=int, default=200)
+    parser.add_argument("--tables", type=int, default=50)
+    parser.add_argument("--indexes", type=int, default=None)
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="compare against a previous report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = regressions(report, baseline, args.tolerance)
+        for failure in failures:
+            print(f"regression: {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+_EPOCH = datetime(2023, 8, 21, tzinfo=timezone.utc)
+
+
+def _iso(ns: int) -> str:
+    return (_EPOCH + timedelta(microseconds=ns // 1000)).strftime(
+        "%Y-%m-%dT%H:%M:%S.%fZ"
+    )
+
+
+def _span(
+    name: str,
+    trace_id: str,
+    span_id: str,
+    parent_id: Optional[str],
+    start: int,
+    end: int,
+    attributes: dict,
+) -> dict:
+    # mirrors the shape of `ReadableSpan.to_json()`
+    return {
+        "name": name,
+        "context": {"trace_id": trace_id, "span_id": span_id, "trace_state": "[]"},
+        "kind": "SpanKind.CLIENT",
+        "parent_id": parent_id,
+        "start_time": _iso(start),
+        "end_time": _iso(end),
+        "status": {"status_code": "UNSET"},
+        "attributes": attributes,
+        "events": [],
+        "links": [],
+        "resource": {
+            "attributes": {
+                "telemetry.sdk.language": "python",
+                "telemetry.sdk.name": "opentelemetry",
+                "telemetry.sdk.version": "1.19.0",
+                "service.name": "unknown_service",
+            },
+            "schema_url": "",
+        },
+    }
+
+
+def generate_statements(distinct_sql: int = 50, tables: int = 50) -> List[str]:
+    """
+    Generates `distinct_sql` distinct statements spread over `tables` tables.
+    """
+    statements = []
+    for i in range(distinct_sql):
+        t = i % tables
+        # the first statement on each table filters on `id`, later ones on other columns
+        column = "id" if i < tables else f"c{i // tables}"
+        statements.append(
+            f'SELECT "t{t}"."id", "t{t}"."name" FROM "t{t}" WHERE "t{t}"."{column}" = %s'
+        )
+    return statements
+
+
+def generate_spans(
+    tests: int = 1000,
+    queries_per_test: int = 20,
+    seed: int = 0,
+    n_plus_one: float = 0.0,
+    distinct_sql: int = 50,
+    tables: int = 50,
+) -> List[dict]:
+    """
+    Generates collector output for a synthetic test suite.
+
+    Each test runs `queries_per_test` queries chosen from `distinct_sql` statements.
+    A fraction (`n_plus_one`) of the tests instead run a list query followed by
+    the same statement for each row (an N+1).
+    """
+    rng = random.Random(seed)
+    statements = generate_statements(distinct_sql=distinct_sql, tables=tables)
+
+    data = []
+    now = 0
+    for test in range(tests):
+        trace_id = f"0x{rng.getrandbits(128):032x}"
+        test_id = f"0x{rng.getrandbits(64):016x}"
+        test_start = now
+
+        if n_plus_one and rng.random() < n_plus_one:
+            t = rng.randrange(tables)
+            queries = [f'SELECT "t{t}"."id" FROM "t{t}" ORDER BY "t{t}"."id"'] + [
+                rng.choice(statements)
+            ] * (queries_per_test - 1)
+        else:
+            queries = [rng.choice(statements) for _ in range(queries_per_test)]
+
+        for statement in queries:
+            now += 1_000_000
+            data.append(
+                _span(
+                    "SELECT",
+                    trace_id,
+                    f"0x{rng.getrandbits(64):016x}",
+                    test_id,
+                    now,
+                    now + 500_000,
+                    {
+                        "db.system": "postgresql",
+                        "db.name": "postgres",
+                        "db.statement": statement,
+                        "db.user": "postgres",
+                        "net.peer.name": "localhost",
+                        "net.peer.port": 5432,
+                    },
+                )
+            )
+        now += 1_000_000
+        data.append(
+            _span(
+                "test",
+                trace_id,
+                test_id,
+                None,
+                test_start,
+                now,
+                {
+                    "test.path": f"tests/test_module_{test % 20}.py",
+                    "test.name": f"test_{test}",
+                    "test.line": test,
+                },
+            )
+        )
+    return data
+
+
+def generate_metadata(tables: int = 50, indexes: Optional[int] = None) -> dict:
+    """
+    Generates metadata with `indexes` indexes on the synthetic tables (by default
+    an index on every other table).
+    """
+    if indexes is None:
+        indexes = (tables + 1) // 2
+
+    return {
+        "explained": {},
+        "indexes": [
+            {
+                "schema_name": "public",
+                "table_name": f"t{(i * 2) % tables}",
+                "index_name": f"t{(i * 2) % tables}_{i}",
+                # the first index on a table covers `id`, later ones other columns
+                "columns": ("id",) if i * 2 < tables else (f"c{i * 2 // tables}",),
+            }
+            for i in range(indexes)
+        ],
+    }
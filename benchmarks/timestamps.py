@@ -0,0 +1,51 @@
+"""
+Compares span timestamp parsing with `dateutil` against `parse_timestamp`.
+
+    python -m benchmarks.timestamps --tests 2000
+"""
+
+import argparse
+import time
+
+from dateutil import parser as dateparser
+
+from benchmarks.synthetic import generate_spans
+from sqlcritic.trace import parse_spans
+from sqlcritic.utils import parse_timestamp
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tests", type=int, default=1000)
+    parser.add_argument("--queries-per-test", type=int, default=20)
+    args = parser.parse_args()
+
+    data = generate_spans(tests=args.tests, queries_per_test=args.queries_per_test)
+    timestamps = [item["start_time"] for item in data] + [
+        item["end_time"] for item in data
+    ]
+    print(f"spans: {len(data)} timestamps: {len(timestamps)}")
+
+    start = time.perf_counter()
+    for value in timestamps:
+        dateparser.parse(value)
+    dateutil_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for value in timestamps:
+        parse_timestamp(value)
+    elapsed = time.perf_counter() - start
+
+    print(f"       dateutil: {dateutil_elapsed:8.3f}s")
+    print(f"parse_timestamp: {elapsed:8.3f}s ({dateutil_elapsed / elapsed:.0f}x)")
+
+    # time saved on a full load is the difference between the two above
+    start = time.perf_counter()
+    parse_spans(data)
+    load_elapsed = time.perf_counter() - start
+    print(f"    parse_spans: {load_elapsed:8.3f}s")
+    print(f"     (dateutil): {load_elapsed + dateutil_elapsed - elapsed:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
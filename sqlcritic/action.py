@@ -1,15 +1,29 @@
+import asyncio
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import asdict, dataclass
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence, TypeVar, Union
 
-from sqlcritic.comparison import Comparison
+from sqlcritic.analyze import analyze, dump_results
+from sqlcritic.comparison import BaseCache, Comparison
 from sqlcritic.database import DatabaseConnection
-from sqlcritic.github import Repo
+from sqlcritic.database.cache import ExplainCache
+from sqlcritic.github import Pull, Repo
 from sqlcritic.notify import GitHubNotifier
-from sqlcritic.storage import Storage
+from sqlcritic.parsing import query_cache
+from sqlcritic.profiling import PROFILE_MODES, profiler
+from sqlcritic.storage import CachedStorage, S3Storage, Storage
 from sqlcritic.trace import parse_spans
 from sqlcritic.utils import load_data
 
+if TYPE_CHECKING:
+    from sqlcritic.github_async import AsyncPull
+
+PullT = TypeVar("PullT", Pull, "AsyncPull")
+
+# stored keys that are rewritten by every run (so are never cached locally)
+MUTABLE_KEY_PREFIXES = ("explain-cache/", "comments/")
+
 
 @dataclass(frozen=True)
 class Config:
@@ -27,35 +41,104 @@ class Config:
 
     # optional inputs
     db_url: Optional[str] = None
+    analysis_workers: int = 1
+    # minimum number of repeated queries reported as an N+1 (`None` for the default)
+    n_plus_one_threshold: Optional[int] = None
+    explain_workers: int = 1
+    # directory for caches that can be persisted across runs
+    cache_dir: Optional[str] = None
+    # maximum size (in MiB) of stored data cached in the cache directory
+    storage_cache_size: int = 1024
+    # number of PRs commented on concurrently (comparisons run one at a time)
+    pull_workers: int = 4
+    # use the asyncio GitHub client (requires `aiohttp`)
+    async_github: bool = False
+    # record stage timings (`stats`), optionally with a full profile (`cprofile`
+    # or `pyinstrument`), and write them to `profile_dir`
+    profile: Optional[str] = None
+    profile_dir: str = "sqlcritic-profile"
 
 
 def run(config: Config):
-    data = load_data(config.data_path)
+    if config.profile:
+        if config.profile not in PROFILE_MODES:
+            raise ValueError(f"unsupported profile mode: {config.profile}")
+        profiler.enable()
+        if config.profile != "stats":
+            profiler.start_dump(config.profile)
+
+    try:
+        _run(config)
+    finally:
+        if config.profile:
+            profiler.stop_dump(config.profile_dir)
+            profiler.report(config.profile_dir)
+
 
-    storage = Storage(
+def _run(config: Config):
+    if config.cache_dir:
+        query_cache.open(config.cache_dir)
+
+    with profiler.stage("load_data"):
+        data = load_data(config.data_path)
+
+    storage: Storage = S3Storage(
         access_key_id=config.aws_access_key_id,
         secret_access_key=config.aws_secret_access_key,
         bucket=config.aws_s3_bucket,
     )
+    if config.cache_dir:
+        storage = CachedStorage(
+            storage,
+            os.path.join(config.cache_dir, "storage"),
+            max_size=config.storage_cache_size * 1024 * 1024,
+            uncached_prefixes=MUTABLE_KEY_PREFIXES,
+        )
     storage.put(f"{config.commit_sha}/spans", data)
 
-    if config.db_url:
-        database = DatabaseConnection(config.db_url)
+    with profiler.stage("parse_spans") as stage:
         spans = parse_spans(data)
-        metadata = {
-            "explained": database.explain(spans),
-            "indexes": [asdict(index) for index in database.indexes()],
-        }
+        stage.count = len(spans)
+    metadata = None
+
+    if config.db_url:
+        database = DatabaseConnection(config.db_url, workers=config.explain_workers)
+        # plans are reused from previous commits as long as the schema is unchanged
+        with profiler.stage("schema_fingerprint"):
+            explain_cache = ExplainCache(storage, database.schema_fingerprint())
+        with profiler.stage("explain") as stage:
+            explained = database.explain(spans, cache=explain_cache)
+            stage.count = len(explained)
+        with profiler.stage("indexes") as stage:
+            indexes = [asdict(index) for index in database.indexes()]
+            stage.count = len(indexes)
+        metadata = {"explained": explained, "indexes": indexes}
+        explain_cache.save()
+        print(f"::debug::explain_cache={explain_cache.stats()}")
         storage.put(f"{config.commit_sha}/metadata", metadata)
 
-    repo = Repo(config.repo, config.repo_token)
+    # analyzed once per commit - later comparisons against this commit only
+    # need the stored results
+    with profiler.stage("analyze", count=len(spans)):
+        results = list(
+            analyze(
+                spans,
+                metadata=metadata,
+                workers=config.analysis_workers,
+                n_plus_one_threshold=config.n_plus_one_threshold,
+            )
+        )
+    storage.put(
+        f"{config.commit_sha}/results",
+        dump_results(results, n_plus_one_threshold=config.n_plus_one_threshold),
+    )
+
+    base_cache = BaseCache()
 
-    for pull in repo.pulls(config.commit_sha):
-        head_data = None
-        head_metadata = None
+    def compare(pull: Union[Pull, "AsyncPull"]) -> Comparison:
+        head_results = None
         if config.commit_sha == pull.head_sha:
-            head_data = data
-            head_metadata = metadata
+            head_results = results
 
         print(f"::debug::pull={pull.number}")
         print(f"::debug::base_sha={pull.base_sha}")
@@ -65,12 +148,113 @@ def run(config: Config):
             storage=storage,
             base_sha=pull.base_sha,
             head_sha=pull.head_sha,
-            head_span_data=head_data,
-            head_metadata=head_metadata,
+            workers=config.analysis_workers,
+            head_analysis_results=head_results,
+            # PRs sharing a base commit only load (or analyze) it once
+            base_cache=base_cache,
+            n_plus_one_threshold=config.n_plus_one_threshold,
         )
+        with profiler.stage("compare"):
+            comparison.prepare()
+        return comparison
+
+    if config.async_github:
+        asyncio.run(notify_async(config, storage, compare))
+    else:
+        repo = Repo(config.repo, config.repo_token, storage=storage)
+
+        def notify(pull: Pull, comparison: "Future[Comparison]"):
+            new_results = list(comparison.result().new_analysis_results())
+            with profiler.stage("github.comment"):
+                notifier = GitHubNotifier(pull)
+                notifier.notify(iter(new_results))
+
+        with profiler.stage("github.pulls") as stage:
+            pulls = repo.pulls(config.commit_sha)
+            stage.count = len(pulls)
+
+        comparisons = compare_all(pulls, compare)
+        with ThreadPoolExecutor(max_workers=config.pull_workers) as executor:
+            futures = [
+                executor.submit(notify, pull, comparison)
+                for pull, comparison in zip(pulls, comparisons)
+            ]
+        # raises the first error (once every PR has been handled)
+        for future in futures:
+            future.result()
+
+    query_cache.save()
+    if isinstance(storage, CachedStorage):
+        print(
+            f"::debug::storage_cache={{'hits': {storage.hits}, 'misses': {storage.misses}}}"
+        )
+
+
+def compare_all(
+    pulls: Sequence[PullT], compare: Callable[[PullT], Comparison]
+) -> List["Future[Comparison]"]:
+    """
+    Compares each PR (loading or analyzing its base and head) one after the
+    other, before the PRs are handled concurrently.  Analysis can start worker
+    processes, so it isn't run from a thread pool (and only one analysis runs
+    at a time).  Errors are raised when the returned futures are resolved.
+    """
+    comparisons: List["Future[Comparison]"] = []
+    for pull in pulls:
+        future: "Future[Comparison]" = Future()
+        try:
+            future.set_result(compare(pull))
+        except Exception as err:
+            future.set_exception(err)
+        comparisons.append(future)
+    return comparisons
+
+
+async def notify_async(
+    config: Config,
+    storage: Storage,
+    compare: Callable[["AsyncPull"], Comparison],
+):
+    """
+    Like the PR loop in `run` but with the asyncio GitHub client so that requests
+    for different PRs overlap.
+    """
+    from sqlcritic.github_async import AsyncRepo
+
+    async with AsyncRepo(config.repo, config.repo_token, storage=storage) as repo:
+        with profiler.stage("github.pulls") as stage:
+            pulls = await repo.pulls(config.commit_sha)
+            stage.count = len(pulls)
+
+        comparisons = compare_all(pulls, compare)
+
+        async def notify(pull: "AsyncPull", comparison: "Future[Comparison]"):
+            results = list(comparison.result().new_analysis_results())
+            with profiler.stage("github.comment"):
+                notifier = GitHubNotifier(pull)
+                await notifier.notify_async(iter(results))
+
+        outcomes = await asyncio.gather(
+            *[notify(pull, comparison) for pull, comparison in zip(pulls, comparisons)],
+            return_exceptions=True,
+        )
+
+    # raises the first error (once every PR has been handled)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+
+
+def _optional_int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value else None
+
 
-        notifier = GitHubNotifier(pull)
-        notifier.notify(comparison.new_analysis_results())
+def _profile_mode(value: Optional[str]) -> Optional[str]:
+    if not value or value.lower() == "false":
+        return None
+    if value.lower() == "true":
+        return "stats"
+    return value
 
 
 if __name__ == "__main__":
@@ -87,6 +271,17 @@ if __name__ == "__main__":
         repo=os.environ["GITHUB_REPOSITORY"],
         commit_sha=os.environ["GITHUB_SHA"],
         db_url=os.environ.get("INPUT_DB-URL"),
+        analysis_workers=int(os.environ.get("INPUT_ANALYSIS-WORKERS") or 1),
+        n_plus_one_threshold=_optional_int(
+            os.environ.get("INPUT_N-PLUS-ONE-THRESHOLD")
+        ),
+        explain_workers=int(os.environ.get("INPUT_EXPLAIN-WORKERS") or 1),
+        cache_dir=os.environ.get("INPUT_CACHE-DIR"),
+        storage_cache_size=int(os.environ.get("INPUT_STORAGE-CACHE-SIZE") or 1024),
+        pull_workers=int(os.environ.get("INPUT_PULL-WORKERS") or 4),
+        async_github=os.environ.get("INPUT_ASYNC-GITHUB", "").lower() == "true",
+        profile=_profile_mode(os.environ.get("INPUT_PROFILE")),
+        profile_dir=os.environ.get("INPUT_PROFILE-DIR") or "sqlcritic-profile",
     )
 
     print(f"::debug::{config}")
@@ -1,17 +1,36 @@
-import re
+import heapq
+import multiprocessing
+import sys
 from abc import ABC, abstractmethod
-from collections import defaultdict
 from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Dict, List, Optional, Set, Type
-
-from sqlglot import exp, parse_one
-
-from sqlcritic.database.types import Index
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+from sqlcritic.database.types import IndexLookup
+from sqlcritic.defaults import N_PLUS_ONE_THRESHOLD
+from sqlcritic.normalize import normalize_sql
+from sqlcritic.parsing import query_cache
+from sqlcritic.profiling import Timer, profiler
 from sqlcritic.trace import Span, Spans, SpanType, Test
 from sqlcritic.utils import fingerprint
 
+# bump whenever a change to the analyzers could change their results
+# (stored results from other versions are then re-analyzed)
+ANALYZER_VERSION = 3
+
 
 class AnalysisType(Enum):
     N_PLUS_ONE = "N_PLUS_ONE"
@@ -33,18 +52,69 @@ class AnalysisResult:
     def fingerprint(self):
         return fingerprint(self.analysis_type.value, *self.queries)
 
+    def to_dict(self) -> dict:
+        return {
+            "analysis_type": self.analysis_type.value,
+            "fingerprint": self.fingerprint,
+            "queries": self.queries,
+            "tests": [[test.path, test.line, test.name] for test in sorted(self.tests)],
+            "extra": self.extra,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AnalysisResult":
+        return AnalysisResult(
+            analysis_type=AnalysisType(data["analysis_type"]),
+            queries=data["queries"],
+            tests=set(Test(path, line, name) for path, line, name in data["tests"]),
+            extra=data["extra"],
+        )
+
+
+# orders results by the span that first produced them (start time, span id and
+# the position among the results produced by that span)
+ResultKey = Tuple[int, str, int]
+
+# results that weren't recorded with `Analyzer.first_seen` come last
+_UNORDERED: ResultKey = (sys.maxsize, "", 0)
+
 
 class Analyzer(ABC):
+    # the span types and names passed to `visit` (`None` means all of them)
+    span_types: Optional[FrozenSet[SpanType]] = None
+    span_names: Optional[FrozenSet[str]] = None
+
     def __init__(self, spans: Spans, metadata: Optional[dict] = None):
         self.spans = spans
         self.metadata = metadata
         self.results: Dict[str, AnalysisResult] = {}
+        self.keys: Dict[str, ResultKey] = {}
 
     def analyze(self) -> List[AnalysisResult]:
-        for span in self.spans:
-            self.visit(span)
-        self.finish()
-        return list(self.results.values())
+        return run_analyzers([self], self.spans)[0]
+
+    def first_seen(self, f: str, span: Span, position: int = 0):
+        """
+        Records that `span` produced the result with fingerprint `f`.  Results
+        are ordered by the earliest span that produced them, so the order
+        doesn't depend on how the spans were sharded (see `partition`).
+        """
+        key = (span.start_time, span.span_id, position)
+        if key < self.keys.get(f, _UNORDERED):
+            self.keys[f] = key
+
+    def keyed_results(self) -> List[Tuple[ResultKey, AnalysisResult]]:
+        return [
+            (self.keys.get(f, _UNORDERED), result) for f, result in self.results.items()
+        ]
+
+    def ordered_results(self) -> List[AnalysisResult]:
+        return [result for _, result in sorted_results(self.keyed_results())]
+
+    def accepts(self, span_type: SpanType, name: str) -> bool:
+        return (self.span_types is None or span_type in self.span_types) and (
+            self.span_names is None or name in self.span_names
+        )
 
     @abstractmethod
     def visit(self, span: Span):
@@ -54,92 +124,121 @@ class Analyzer(ABC):
         pass
 
     def test_info(self, span: Span) -> Optional[Test]:
-        parent_span = None
-        while True:
-            parent_span = self.spans.parent_span(span)
-            if parent_span is None:
-                # we've traversed to the root span
-                return None
-
-            if parent_span.span_type == SpanType.TEST:
-                return parent_span.test
-
-            span = parent_span
+        return self.spans.test_for(span)
 
 
 class NPlusOneAnalyzer(Analyzer):
-    def __init__(self, spans: Spans, metadata: Optional[dict] = None):
+    """
+    Finds statements that are executed `threshold` or more times under the same
+    parent span following a source query.
+
+    Children of each parent are recorded by normalized SQL and each parent is
+    checked once no more of its children can be visited.  The N queries can be
+    interleaved with other queries, as long as every statement between the
+    source and the last of the N queries is repeated (i.e. it's the body of a
+    loop over the source's results).
+    """
+
+    span_types = frozenset([SpanType.DB])
+    span_names = frozenset(["SELECT"])
+    threshold = N_PLUS_ONE_THRESHOLD
+
+    def __init__(
+        self,
+        spans: Spans,
+        metadata: Optional[dict] = None,
+        threshold: Optional[int] = None,
+    ):
         super().__init__(spans, metadata=metadata)
-        self._source_span: Optional[Span] = None
-        self._source_sql: Optional[str] = None
-        self._n_spans: List[Span] = []
-        self._n_sql: Optional[str] = None
+        if threshold is not None:
+            self.threshold = threshold
+        # a child span and the statements executed (in order) for each parent
+        self._windows: Dict[str, Tuple[Span, List[str]]] = {}
+        # parents by end time (no children are visited after that)
+        self._ends: List[Tuple[int, str]] = []
         self.results = {}
 
     def visit(self, span: Span):
+        while self._ends and self._ends[0][0] <= span.start_time:
+            _, parent_id = heapq.heappop(self._ends)
+            self._check(parent_id)
+
         if (
             span.span_type == SpanType.DB
             and span.name == "SELECT"
             and span.parent_id is not None
         ):
-            # this is a db query span
-            sql = span.sql
-
-            if self._source_span is None:
-                # searching for the N+1 - maybe this span is the source that triggered it
-                self._reset(span)
-                return
-
-            if span.parent_id != self._source_span.parent_id:
-                # we have a new parent now, reset the detection
-                self._reset(span)
-                return
-
-            if sql == self._source_sql:
-                self._reset(span)
-                return
-
-            if self._n_sql is None or sql == self._n_sql:
-                # we have a potential source and this is now a different query
-                # with the same parent - maybe there's N of them
-                self._n_sql = sql
-                self._n_spans.append(span)
-                return
-
-            self._reset(span)
+            assert span.sql is not None
+            window = self._windows.get(span.parent_id)
+            if window is None:
+                window = self._windows[span.parent_id] = (span, [])
+                parent = self.spans.index.get(span.parent_id)
+                if parent is not None:
+                    heapq.heappush(self._ends, (parent.end_time, span.parent_id))
+            window[1].append(normalize_sql(span.sql))
 
     def finish(self):
-        if len(self._n_spans) > 1:
-            self._save_result()
-
-    def _fingerprint(self):
-        return fingerprint(self._source_sql, self._n_sql)
-
-    def _reset(self, span: Span):
-        if len(self._n_spans) > 1:
-            self._save_result()
-        self._source_span = span
-        self._source_sql = span.sql
-        self._n_spans = []
-        self._n_sql = None
-
-    def _save_result(self):
-        fingerprint = self._fingerprint()
-        if fingerprint not in self.results:
-            self.results[fingerprint] = AnalysisResult(
+        for parent_id in list(self._windows):
+            self._check(parent_id)
+        self._ends = []
+
+    def _check(self, parent_id: str):
+        window = self._windows.pop(parent_id, None)
+        if window is None:
+            return
+        span, statements = window
+
+        # position of the next execution of the same statement (if any)
+        next_index = [len(statements)] * len(statements)
+        last: Dict[str, int] = {}
+        for i in range(len(statements) - 1, -1, -1):
+            next_index[i] = last.get(statements[i], len(statements))
+            last[statements[i]] = i
+
+        position = 0
+        for i, source_sql in enumerate(statements):
+            # count the statements following the source (until it's executed
+            # again) up to the first that isn't repeated before then
+            end = next_index[i]
+            counts: Dict[str, int] = {}
+            for j in range(i + 1, end):
+                sql = statements[j]
+                if sql not in counts and next_index[j] >= end:
+                    break
+                counts[sql] = counts.get(sql, 0) + 1
+
+            for sql, count in counts.items():
+                if count >= self.threshold:
+                    self._save_result(span, source_sql, sql, count, position)
+                    position += 1
+
+    def _save_result(
+        self, span: Span, source_sql: str, n_sql: str, count: int, position: int
+    ):
+        f = fingerprint(source_sql, n_sql)
+        # ordered by the parent's first child (the same in any shard)
+        self.first_seen(f, span, position)
+        if f not in self.results:
+            self.results[f] = AnalysisResult(
                 analysis_type=AnalysisType.N_PLUS_ONE,
-                queries=[self._source_sql, self._n_sql],
+                queries=[source_sql, n_sql],
                 tests=set(),
+                extra={"count": count},
             )
-        test = self.test_info(self._source_span)
+        result = self.results[f]
+        if result.extra is not None:
+            result.extra["count"] = max(result.extra["count"], count)
+        test = self.test_info(span)
         if test is not None:
-            self.results[fingerprint].tests.add(test)
+            result.tests.add(test)
 
 
 class SeqScanAnalyzer(Analyzer):
     # TODO: this is all very Postgres-specific
     # will need to abstract a lot of this when there are other plan formats
 
+    span_types = frozenset([SpanType.DB])
+
     def visit(self, span: Span):
         if self.metadata is None:
             return
@@ -154,6 +253,7 @@ class SeqScanAnalyzer(Analyzer):
                 assert span.sql is not None
                 f = fingerprint(span.sql)
                 if f not in self.results:
+                    self.first_seen(f, span)
                     self.results[f] = AnalysisResult(
                         analysis_type=AnalysisType.SEQ_SCAN,
                         queries=[span.sql],
@@ -177,12 +277,17 @@ class SeqScanAnalyzer(Analyzer):
 
 
 class MissingIndexAnalyzer(Analyzer):
-    def visit(self, span: Span):
-        if self.metadata is None:
-            return
+    span_types = frozenset([SpanType.DB])
+    span_names = frozenset(["SELECT"])
 
-        indexes = self.metadata.get("indexes")
-        if indexes is None:
+    def __init__(self, spans: Spans, metadata: Optional[dict] = None):
+        super().__init__(spans, metadata=metadata)
+        self.indexes: Optional[IndexLookup] = None
+        if self.metadata is not None and self.metadata.get("indexes") is not None:
+            self.indexes = IndexLookup.from_metadata(self.metadata["indexes"])
+
+    def visit(self, span: Span):
+        if self.indexes is None:
             return
 
         if span.span_type == SpanType.DB and span.name == "SELECT":
@@ -193,55 +298,22 @@ class MissingIndexAnalyzer(Analyzer):
                 return
 
             f = fingerprint(span.sql)
-            sql = span.sql
-
-            # replace '%s' placeholders with '$N' where N=1..
-            r = re.compile(r"\%s")
-            n = len(r.findall(sql))
-            for i in range(1, n + 1):
-                sql = sql.replace("%s", f"${i}", 1)
-
-            ast = parse_one(sql)
-
-            # collect all table aliases
-            table_aliases = {}
-            for node in ast.find_all(exp.From):
-                table_aliases[node.alias_or_name] = node.name
-            for join in ast.find_all(exp.Join):
-                tables = join.find_all(exp.Table)
-                for table in tables:
-                    table_aliases[table.alias_or_name] = table.name
-
-            # TODO: do something similar for `order by`
-            for where in ast.find_all(exp.Where):
-                columns = where.find_all(exp.Column)
-
-                # group columns by table - if there are multiple tables
-                # then the database will scan each index and create bitmaps
-                # that are combined together
-                by_table = defaultdict(list)
-                for column in columns:
-                    table_name = table_aliases.get(column.table) or column.table
-                    if not table_name:
-                        continue
-                    by_table[table_name].append(column.name)
+            parsed = query_cache.get(span.sql)
+            table_aliases = parsed.table_aliases
 
+            for by_table in parsed.where_columns:
                 # for each table try and find an index that includes all columns
                 # as a contiguous leading subset
                 for table_name, column_names in by_table.items():
-                    found_index = False
-                    for index in indexes:
-                        index = Index(**index)
-                        index_table_name = (
-                            table_aliases.get(index.table_name) or index.table_name
+                    found_index = any(
+                        self.indexes.indexes_columns(index_table_name, column_names)
+                        for index_table_name in self._index_tables(
+                            table_name, table_aliases
                         )
-                        if table_name == index_table_name and index.indexes_columns(
-                            column_names
-                        ):
-                            found_index = True
-                            break
+                    )
                     if not found_index:
                         if f not in self.results:
+                            self.first_seen(f, span)
                             self.results[f] = AnalysisResult(
                                 analysis_type=AnalysisType.MISSING_INDEX,
                                 queries=[span.sql],
@@ -250,11 +322,27 @@ class MissingIndexAnalyzer(Analyzer):
                             )
                         extra = self.results[f].extra
                         if extra is not None:
-                            extra[table_name] = column_names
+                            extra[table_name] = list(column_names)
 
             if f in self.results:
                 self.results[f].tests.add(test)
 
+    def _index_tables(
+        self, table_name: str, table_aliases: Dict[str, str]
+    ) -> List[str]:
+        """
+        Returns the names of tables whose indexes apply to the given table.
+        Index table names are resolved through the query's aliases.
+        """
+        names = [
+            name
+            for name, aliased in table_aliases.items()
+            if aliased == table_name and name != table_name
+        ]
+        if (table_aliases.get(table_name) or table_name) == table_name:
+            names.append(table_name)
+        return names
+
 
 analyzers: List[Type[Analyzer]] = [
     NPlusOneAnalyzer,
@@ -263,6 +351,282 @@ analyzers: List[Type[Analyzer]] = [
 ]
 
 
-def analyze(spans: Spans, metadata: Optional[dict] = None) -> Iterator[AnalysisResult]:
-    for analyzer in analyzers:
-        yield from analyzer(spans, metadata=metadata).analyze()
+def run_analyzers(
+    instances: List[Analyzer], spans: Spans
+) -> List[List[AnalysisResult]]:
+    """
+    Feeds every span to each of the given analyzers in a single pass and
+    returns the results of each analyzer (in the same order as the analyzers,
+    each ordered as in `Analyzer.ordered_results`).
+    """
+    visits: List[Callable[[Span], None]] = [instance.visit for instance in instances]
+    if profiler.enabled:
+        visits = [Timer(visit) for visit in visits]
+
+    # analyzers interested in each (span type, span name) pair
+    dispatch: Dict[Tuple[SpanType, str], List[Callable[[Span], None]]] = {}
+
+    for span in spans:
+        key = (span.span_type, span.name)
+        visitors = dispatch.get(key)
+        if visitors is None:
+            visitors = dispatch[key] = [
+                visit
+                for instance, visit in zip(instances, visits)
+                if instance.accepts(span.span_type, span.name)
+            ]
+        for visit in visitors:
+            visit(span)
+
+    for instance in instances:
+        instance.finish()
+
+    for instance, visit in zip(instances, visits):
+        if isinstance(visit, Timer):
+            profiler.record(
+                f"analyze.{type(instance).__name__}",
+                wall=visit.wall,
+                cpu=visit.cpu,
+                count=visit.count,
+            )
+    return [instance.ordered_results() for instance in instances]
+
+
+def sorted_results(
+    keyed: Iterable[Tuple[ResultKey, AnalysisResult]],
+) -> List[Tuple[ResultKey, AnalysisResult]]:
+    return sorted(keyed, key=lambda item: item[0])
+
+
+def partition(spans: Spans, shards: int) -> List[List[Span]]:
+    """
+    Splits spans into (at most) the given number of shards.
+
+    Spans are grouped by the test they were executed from (or by trace outside
+    of tests) and whole groups are handed out to the shards in turn.  A query's
+    parent and test are then in the same shard as the query, so a shard finds
+    the same results for its queries as analyzing all of the spans at once
+    (even when traces overlap, i.e. merged pytest-xdist shards).  Each shard
+    keeps the spans' time order.
+    """
+    groups: Dict[str, str] = {}
+    shard_of_group: Dict[str, int] = {}
+    result: List[List[Span]] = [[] for _ in range(max(1, shards))]
+
+    for span in spans:
+        # the nearest test span (or the trace) this span belongs to
+        chain = []
+        current = span
+        while True:
+            group = groups.get(current.span_id)
+            if group is not None:
+                break
+            chain.append(current.span_id)
+            if current.span_type == SpanType.TEST:
+                group = current.span_id
+                break
+            parent = (
+                spans.index.get(current.parent_id)
+                if current.parent_id is not None
+                else None
+            )
+            if parent is None:
+                group = current.trace_id
+                break
+            current = parent
+        for span_id in chain:
+            groups[span_id] = group
+
+        shard = shard_of_group.get(group)
+        if shard is None:
+            shard = shard_of_group[group] = len(shard_of_group) % len(result)
+        result[shard].append(span)
+
+    return [shard for shard in result if shard]
+
+
+def merge_results(
+    shard_results: List[List[Tuple[ResultKey, AnalysisResult]]],
+) -> List[AnalysisResult]:
+    """
+    Combines the (keyed) results of a single analyzer across shards, in the
+    same order as analyzing all of the spans at once.
+    """
+    merged: Dict[str, Tuple[ResultKey, AnalysisResult]] = {}
+    for results in shard_results:
+        for key, result in results:
+            existing = merged.get(result.fingerprint)
+            if existing is None:
+                merged[result.fingerprint] = (key, result)
+                continue
+            merged[result.fingerprint] = (min(existing[0], key), existing[1])
+            target = existing[1]
+            target.tests.update(result.tests)
+            if result.extra is not None:
+                if target.extra is None:
+                    target.extra = {}
+                if result.analysis_type == AnalysisType.N_PLUS_ONE:
+                    # the most repetitions seen in any shard
+                    count = max(target.extra["count"], result.extra["count"])
+                    target.extra.update(result.extra, count=count)
+                else:
+                    target.extra.update(result.extra)
+    return [result for _, result in sorted_results(merged.values())]
+
+
+_worker_state: Dict[str, Any] = {}
+
+
+def create_analyzers(
+    analyzer_types: List[Type[Analyzer]],
+    spans: Spans,
+    metadata: Optional[dict] = None,
+    n_plus_one_threshold: Optional[int] = None,
+) -> List[Analyzer]:
+    return [
+        (
+            analyzer(spans, metadata=metadata, threshold=n_plus_one_threshold)
+            if issubclass(analyzer, NPlusOneAnalyzer)
+            else analyzer(spans, metadata=metadata)
+        )
+        for analyzer in analyzer_types
+    ]
+
+
+def _init_worker(
+    analyzer_types: List[Type[Analyzer]],
+    metadata: Optional[dict],
+    n_plus_one_threshold: Optional[int],
+    stored_queries: Optional[Dict[str, dict]],
+):
+    _worker_state["analyzers"] = analyzer_types
+    _worker_state["metadata"] = metadata
+    _worker_state["n_plus_one_threshold"] = n_plus_one_threshold
+    if stored_queries is not None:
+        query_cache.load(stored_queries)
+
+
+def _analyze_shard(
+    shard: List[Span],
+) -> Tuple[List[List[Tuple[ResultKey, AnalysisResult]]], Dict[str, dict]]:
+    spans = Spans(shard)
+    instances = create_analyzers(
+        _worker_state["analyzers"],
+        spans,
+        metadata=_worker_state["metadata"],
+        n_plus_one_threshold=_worker_state["n_plus_one_threshold"],
+    )
+    run_analyzers(instances, spans)
+    keyed = [instance.keyed_results() for instance in instances]
+    # queries parsed in the worker are sent back so the parent can persist them
+    return keyed, query_cache.take_used()
+
+
+def analyze_parallel(
+    spans: Spans,
+    metadata: Optional[dict] = None,
+    workers: int = 2,
+    n_plus_one_threshold: Optional[int] = None,
+) -> List[List[AnalysisResult]]:
+    """
+    Runs the analyzers over shards of the spans in a pool of worker processes.
+    The results are identical to running them serially.
+
+    Workers are spawned rather than forked since the action can have other
+    threads running (i.e. the asyncio GitHub client's resolver).
+    """
+    # a few shards per worker keeps the pool busy when shards vary in cost
+    shards = partition(spans, workers * 4)
+    stored_queries = query_cache.stored() if query_cache.path is not None else None
+
+    shard_results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(list(analyzers), metadata, n_plus_one_threshold, stored_queries),
+    ) as executor:
+        for results, used_queries in executor.map(_analyze_shard, shards):
+            shard_results.append(results)
+            query_cache.add_used(used_queries)
+
+    return [
+        merge_results([results[i] for results in shard_results])
+        for i in range(len(analyzers))
+    ]
+
+
+def analyze(
+    spans: Spans,
+    metadata: Optional[dict] = None,
+    workers: Optional[int] = None,
+    n_plus_one_threshold: Optional[int] = None,
+) -> Iterator[AnalysisResult]:
+    """
+    Runs every analyzer over the spans (in `workers` processes if more than one).
+    `n_plus_one_threshold` overrides `NPlusOneAnalyzer.threshold`.
+    """
+    if workers is not None and workers > 1:
+        analyzer_results = analyze_parallel(
+            spans,
+            metadata=metadata,
+            workers=workers,
+            n_plus_one_threshold=n_plus_one_threshold,
+        )
+    else:
+        instances = create_analyzers(
+            analyzers,
+            spans,
+            metadata=metadata,
+            n_plus_one_threshold=n_plus_one_threshold,
+        )
+        analyzer_results = run_analyzers(instances, spans)
+
+    for results in analyzer_results:
+        yield from results
+
+
+def dump_results(
+    results: Iterable[AnalysisResult], n_plus_one_threshold: Optional[int] = None
+) -> dict:
+    """
+    Serializes analysis results (tagged with the analyzer version and settings)
+    for storage.
+    """
+    return {
+        "version": ANALYZER_VERSION,
+        "n_plus_one_threshold": n_plus_one_threshold or NPlusOneAnalyzer.threshold,
+        "results": [result.to_dict() for result in results],
+    }
+
+
+def _is_current(data: Optional[dict], n_plus_one_threshold: Optional[int]) -> bool:
+    return (
+        data is not None
+        and data.get("version") == ANALYZER_VERSION
+        and data.get("n_plus_one_threshold")
+        == (n_plus_one_threshold or NPlusOneAnalyzer.threshold)
+    )
+
+
+def load_results(
+    data: Optional[dict], n_plus_one_threshold: Optional[int] = None
+) -> Optional[List[AnalysisResult]]:
+    """
+    Loads stored analysis results (or `None` if they're missing or were produced
+    by a different analyzer version or with a different N+1 threshold).
+    """
+    if data is None or not _is_current(data, n_plus_one_threshold):
+        return None
+    return [AnalysisResult.from_dict(item) for item in data["results"]]
+
+
+def load_fingerprints(
+    data: Optional[dict], n_plus_one_threshold: Optional[int] = None
+) -> Optional[Set[str]]:
+    """
+    Like `load_results` but only loads the result fingerprints.
+    """
+    if data is None or not _is_current(data, n_plus_one_threshold):
+        return None
+    return set(item["fingerprint"] for item in data["results"])
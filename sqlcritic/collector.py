@@ -1,41 +1,188 @@
 import json
 import os
 from contextlib import contextmanager
-from typing import List
+from typing import Dict, List, Optional, Union
 
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
 from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
 
+from sqlcritic.compact import SQL_ATTRIBUTE, CompactEncoder
+from sqlcritic.export import NDJSONSpanExporter, encode_span
+from sqlcritic.normalize import normalize_sql
+from sqlcritic.processor import FilteringSpanProcessor, TimedSpanProcessor
+from sqlcritic.shards import shard_path
+from sqlcritic.utils import is_ndjson, load_data, write_spans
+
 
 class Collector:
-    def __init__(self):
-        self.exporter = InMemorySpanExporter()
-        self.processor = SimpleSpanProcessor(self.exporter)
+    def __init__(
+        self,
+        stream_path: Optional[str] = None,
+        buffer_size: int = 1000,
+        normalize_sql: bool = False,
+        batch: bool = False,
+        batch_queue_size: int = 65536,
+        db_and_tests_only: bool = False,
+        tests_only: bool = False,
+        max_repeats: Optional[int] = None,
+        n_plus_one_threshold: Optional[int] = None,
+        sharded: bool = False,
+        timed: bool = False,
+        root: Optional[str] = None,
+    ):
+        """
+        By default finished spans are kept in memory until `save_results` is called.
+        If a `stream_path` is given then spans are instead written incrementally to
+        that file as newline-delimited JSON (holding at most `buffer_size` in memory).
+
+        If `normalize_sql` is set then literals and placeholders in SQL statements
+        are replaced so that statements only differing by their parameters are
+        stored (and analyzed) as one (see `sqlcritic.normalize`).
+
+        If `batch` is set then spans are exported from a background thread rather
+        than as each one ends (at most `batch_queue_size` spans are queued - any
+        more are dropped).  Spans that aren't needed for analysis can be dropped
+        with `db_and_tests_only`, `tests_only` and `max_repeats` (see
+        `FilteringSpanProcessor` - `n_plus_one_threshold` is the action's
+        `n-plus-one-threshold` input, if set).
+
+        If `sharded` is set then each process writes to its own file named after
+        its pytest-xdist worker (see `sqlcritic.shards`) - `stream_path` and the
+        path given to `save_results` are used as templates (i.e. `results.ndjson`
+        becomes `results.gw0.ndjson`).
+
+        If `timed` is set then the time spent processing spans is recorded (see
+        `TimedSpanProcessor`).  Test paths are made relative to `root` (the
+        current directory by default).
+        """
+        self.root = os.getcwd() if root is None else root
+        self._relpaths: Dict[str, str] = {}
+        self.sharded = sharded
+        if sharded and stream_path is not None:
+            stream_path = shard_path(stream_path)
+        self.stream_path = stream_path
+        self.normalize_sql = normalize_sql
+        self.exporter: Union[InMemorySpanExporter, NDJSONSpanExporter]
+        if stream_path is None:
+            self.exporter = InMemorySpanExporter()
+        else:
+            self.exporter = NDJSONSpanExporter(
+                stream_path, buffer_size=buffer_size, normalize=normalize_sql
+            )
+        self.processor: SpanProcessor
+        if batch:
+            self.processor = BatchSpanProcessor(
+                self.exporter,
+                max_queue_size=batch_queue_size,
+                max_export_batch_size=min(buffer_size, batch_queue_size),
+            )
+        else:
+            self.processor = SimpleSpanProcessor(self.exporter)
+        if db_and_tests_only or tests_only or max_repeats is not None:
+            self.processor = FilteringSpanProcessor(
+                self.processor,
+                db_and_tests_only=db_and_tests_only,
+                tests_only=tests_only,
+                max_repeats=max_repeats,
+                normalize=normalize_sql,
+                n_plus_one_threshold=n_plus_one_threshold,
+            )
+        if timed:
+            self.processor = TimedSpanProcessor(self.processor)
 
         self.provider = TracerProvider()
         self.provider.add_span_processor(self.processor)
 
         trace.set_tracer_provider(self.provider)
-        self.tracer = trace.get_tracer("sqlcritic")
+        self.tracer = self.provider.get_tracer("sqlcritic")
 
     @contextmanager
     def trace_test(self, path: str, line: int, name: str):
-        cwd = os.getcwd()
-        relpath = os.path.relpath(path, cwd)
+        relpath = self._relpaths.get(path)
+        if relpath is None:
+            relpath = self._relpaths[path] = os.path.relpath(path, self.root)
 
-        with self.tracer.start_as_current_span("test") as span:
-            span.set_attribute("test.path", relpath)
-            span.set_attribute("test.name", name)
-            span.set_attribute("test.line", line)
+        # set up front so that span processors can tell this is a test span
+        attributes: Dict[str, Union[str, int]] = {
+            "test.path": relpath,
+            "test.name": name,
+            "test.line": line,
+        }
+        with self.tracer.start_as_current_span("test", attributes=attributes):
             yield
 
     def results(self) -> List[dict]:
+        self.processor.force_flush()
+        if isinstance(self.exporter, NDJSONSpanExporter):
+            self.exporter.force_flush()
+            data = load_data(self.exporter.path)
+            assert isinstance(data, list)
+            return data
+
         spans = self.exporter.get_finished_spans()
         data = [json.loads(span.to_json()) for span in spans]
+        if self.normalize_sql:
+            for item in data:
+                attributes = item["attributes"]
+                if SQL_ATTRIBUTE in attributes:
+                    attributes[SQL_ATTRIBUTE] = normalize_sql(attributes[SQL_ATTRIBUTE])
         return data
 
-    def save_results(self, output_path: str):
+    def save_results(self, output_path: str, compact: bool = False):
+        """
+        Writes all collected spans to `output_path`.  If `compact` is set then the
+        compact columnar format is written (see `sqlcritic.compact`) instead.
+
+        Streamed spans are written as NDJSON if `output_path` ends with `.ndjson`
+        (or `.jsonl`) and are otherwise converted to a JSON array.
+        """
+        self.processor.force_flush()
+        if self.sharded:
+            output_path = shard_path(output_path)
+        if compact:
+            self._save_compact(output_path)
+            return
+
+        if isinstance(self.exporter, NDJSONSpanExporter):
+            # spans have already been written - just make sure they're all on disk
+            self.exporter.shutdown()
+            if is_ndjson(output_path):
+                if os.path.abspath(output_path) != os.path.abspath(self.exporter.path):
+                    os.replace(self.exporter.path, output_path)
+                return
+
+            # other paths are read as a single JSON document (see `load_data`)
+            tmp_path = f"{output_path}.tmp"
+            with open(self.exporter.path) as src, open(tmp_path, "w") as dst:
+                write_spans(
+                    (json.loads(line) for line in src if line.strip()),
+                    dst,
+                    ndjson=False,
+                )
+            os.replace(tmp_path, output_path)
+            if os.path.abspath(output_path) != os.path.abspath(self.exporter.path):
+                os.remove(self.exporter.path)
+            return
+
         with open(output_path, "w") as f:
             json.dump(self.results(), f)
+
+    def _save_compact(self, output_path: str):
+        encoder = CompactEncoder(normalize=self.normalize_sql)
+
+        if isinstance(self.exporter, NDJSONSpanExporter):
+            self.exporter.shutdown()
+            with open(self.exporter.path) as f:
+                for line in f:
+                    if line.strip():
+                        encoder.add_dict(json.loads(line))
+            if os.path.abspath(output_path) != os.path.abspath(self.exporter.path):
+                os.remove(self.exporter.path)
+        else:
+            for span in self.exporter.get_finished_spans():
+                encode_span(encoder, span)
+
+        with open(output_path, "w") as f:
+            json.dump(encoder.encode(), f)
@@ -0,0 +1,200 @@
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from sqlcritic.normalize import normalize_sql
+from sqlcritic.utils import format_timestamp, parse_timestamp
+
+COMPACT_FORMAT = "sqlcritic-compact"
+COMPACT_VERSION = 1
+
+# the only span attributes that are used during analysis
+TEST_ATTRIBUTES = ("test.path", "test.line", "test.name")
+SQL_ATTRIBUTE = "db.statement"
+
+
+def is_compact(data: Any) -> bool:
+    return isinstance(data, dict) and data.get("format") == COMPACT_FORMAT
+
+
+class CompactEncoder:
+    """
+    Builds the compact columnar results format.
+
+    Only the span fields needed for analysis are kept.  Each column is a list
+    with one entry per span, repeated strings (span names, trace ids, SQL) are
+    stored once in a string table and referenced by position, tests are stored
+    once in a test table and timestamps are integer nanoseconds since the epoch.
+
+    If `normalize` is set then SQL is normalized (see `sqlcritic.normalize`) and
+    the number of times each test executed each statement is also recorded.
+    """
+
+    def __init__(self, normalize: bool = False):
+        self.normalize = normalize
+        self._strings: Dict[str, int] = {}
+        self._tests: Dict[Tuple[Any, ...], int] = {}
+        self.columns: Dict[str, List[Any]] = {
+            "name": [],
+            "trace_id": [],
+            "span_id": [],
+            "parent_id": [],
+            "start_time": [],
+            "end_time": [],
+            "sql": [],
+            "test": [],
+        }
+
+    def __len__(self) -> int:
+        return len(self.columns["span_id"])
+
+    def add(
+        self,
+        name: str,
+        trace_id: str,
+        span_id: str,
+        parent_id: Optional[str],
+        start_time: int,
+        end_time: int,
+        attributes: Mapping[str, Any],
+    ):
+        sql = attributes.get(SQL_ATTRIBUTE)
+        if sql is not None and self.normalize:
+            sql = normalize_sql(sql)
+        test = None
+        if sql is None and "test.name" in attributes:
+            test = self._test(*[attributes[key] for key in TEST_ATTRIBUTES])
+
+        columns = self.columns
+        columns["name"].append(self._string(name))
+        columns["trace_id"].append(self._string(trace_id))
+        columns["span_id"].append(span_id)
+        columns["parent_id"].append(parent_id)
+        columns["start_time"].append(start_time)
+        columns["end_time"].append(end_time)
+        columns["sql"].append(None if sql is None else self._string(sql))
+        columns["test"].append(test)
+
+    def add_dict(self, data: dict):
+        """
+        Adds a span in the JSON format written by `Collector.save_results`.
+        """
+        self.add(
+            name=data["name"],
+            trace_id=data["context"]["trace_id"],
+            span_id=data["context"]["span_id"],
+            parent_id=data["parent_id"],
+            start_time=parse_timestamp(data["start_time"]),
+            end_time=parse_timestamp(data["end_time"]),
+            attributes=data["attributes"],
+        )
+
+    def encode(self) -> dict:
+        data = {
+            "format": COMPACT_FORMAT,
+            "version": COMPACT_VERSION,
+            "strings": list(self._strings),
+            "tests": list(self._tests),
+            "spans": self.columns,
+        }
+        if self.normalize:
+            data["occurrences"] = self.occurrences()
+        return data
+
+    def occurrences(self) -> List[List[int]]:
+        """
+        Returns `[test, sql, count]` for each statement executed by each test
+        (as references into the test and string tables).
+        """
+        columns = self.columns
+        index = {span_id: i for i, span_id in enumerate(columns["span_id"])}
+        parents = columns["parent_id"]
+        tests = columns["test"]
+
+        # the test each span descends from (spans finish before their parents so
+        # the test isn't known until every span has been added)
+        owners: Dict[int, Optional[int]] = {}
+
+        def owner(i: int) -> Optional[int]:
+            chain = []
+            test = None
+            current: Optional[int] = i
+            while current is not None:
+                if current in owners:
+                    test = owners[current]
+                    break
+                chain.append(current)
+                if tests[current] is not None:
+                    test = tests[current]
+                    break
+                parent_id = parents[current]
+                current = None if parent_id is None else index.get(parent_id)
+            for j in chain:
+                owners[j] = test
+            return test
+
+        counts: Dict[Tuple[int, int], int] = {}
+        for i, sql in enumerate(columns["sql"]):
+            if sql is None:
+                continue
+            test = owner(i)
+            if test is not None:
+                counts[(test, sql)] = counts.get((test, sql), 0) + 1
+        return [[test, sql, count] for (test, sql), count in counts.items()]
+
+    def _string(self, value: str) -> int:
+        ref = self._strings.get(value)
+        if ref is None:
+            ref = self._strings[value] = len(self._strings)
+        return ref
+
+    def _test(self, path: str, line: int, name: str) -> int:
+        key = (self._string(path), line, self._string(name))
+        ref = self._tests.get(key)
+        if ref is None:
+            ref = self._tests[key] = len(self._tests)
+        return ref
+
+
+def iter_compact(data: dict) -> Iterator[dict]:
+    """
+    Converts the compact format back into collector JSON output (only the fields
+    that are kept in the compact format are included).
+    """
+    strings = data["strings"]
+    columns = data["spans"]
+    for name, trace_id, span_id, parent_id, start, end, sql, test in zip(
+        columns["name"],
+        columns["trace_id"],
+        columns["span_id"],
+        columns["parent_id"],
+        columns["start_time"],
+        columns["end_time"],
+        columns["sql"],
+        columns["test"],
+    ):
+        attributes: Dict[str, Any] = {}
+        if sql is not None:
+            attributes[SQL_ATTRIBUTE] = strings[sql]
+        elif test is not None:
+            path, line, test_name = data["tests"][test]
+            attributes["test.path"] = strings[path]
+            attributes["test.line"] = line
+            attributes["test.name"] = strings[test_name]
+
+        yield {
+            "name": strings[name],
+            "context": {"trace_id": strings[trace_id], "span_id": span_id},
+            "parent_id": parent_id,
+            "start_time": format_timestamp(start),
+            "end_time": format_timestamp(end),
+            "attributes": attributes,
+        }
+
+
+def compact(data: List[dict], normalize: bool = False) -> dict:
+    """
+    Converts collector JSON output into the compact format.
+    """
+    encoder = CompactEncoder(normalize=normalize)
+    for item in data:
+        encoder.add_dict(item)
+    return encoder.encode()
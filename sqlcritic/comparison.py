@@ -1,7 +1,16 @@
+import threading
+from concurrent.futures import Future
 from functools import cached_property
-from typing import Any, Iterator, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
 
-from sqlcritic.analyze import AnalysisResult, analyze
+from sqlcritic.analyze import (
+    AnalysisResult,
+    analyze,
+    dump_results,
+    load_fingerprints,
+    load_results,
+)
+from sqlcritic.profiling import profiler
 from sqlcritic.storage import Storage
 from sqlcritic.trace import parse_spans
 
@@ -18,6 +27,32 @@ class MissingHeadError(Exception):
         self.sha = sha
 
 
+class BaseCache:
+    """
+    Shares base commit fingerprints between comparisons so that each base commit
+    is loaded (or analyzed) only once, even when comparisons run concurrently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+
+    def get(self, sha: str, load: Callable[[], Set[str]]) -> Set[str]:
+        with self._lock:
+            future = self._futures.get(sha)
+            loading = future is None
+            if future is None:
+                future = self._futures[sha] = Future()
+
+        if loading:
+            # other threads wait on the future until this one has loaded it
+            try:
+                future.set_result(load())
+            except Exception as err:
+                future.set_exception(err)
+        return future.result()
+
+
 class Comparison:
     def __init__(
         self,
@@ -26,12 +61,48 @@ class Comparison:
         head_sha: str,
         head_span_data: Optional[Any] = None,
         head_metadata: Optional[Any] = None,
+        workers: int = 1,
+        head_analysis_results: Optional[List[AnalysisResult]] = None,
+        base_cache: Optional[BaseCache] = None,
+        n_plus_one_threshold: Optional[int] = None,
     ):
         self.storage = storage
         self.base_sha = base_sha
         self.head_sha = head_sha
         self.head_span_data = head_span_data
         self.head_metadata = head_metadata
+        # number of processes used for analysis
+        self.workers = workers
+        # results of analyzing the head commit (if already known)
+        self.head_analysis_results = head_analysis_results
+        self.base_cache = base_cache
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    @cached_property
+    def base_fingerprints(self) -> Set[str]:
+        """
+        Fingerprints of the base results, loaded from storage when the base commit
+        was analyzed by this analyzer version and re-analyzed (and stored) otherwise.
+        """
+        if self.base_cache is not None:
+            return self.base_cache.get(self.base_sha, self._load_base_fingerprints)
+        return self._load_base_fingerprints()
+
+    def _load_base_fingerprints(self) -> Set[str]:
+        fingerprints = load_fingerprints(
+            self.storage.get(f"{self.base_sha}/results"),
+            n_plus_one_threshold=self.n_plus_one_threshold,
+        )
+        if fingerprints is not None:
+            return fingerprints
+
+        with profiler.stage("analyze_base"):
+            results = list(self.base_results)
+        self.storage.put(
+            f"{self.base_sha}/results",
+            dump_results(results, n_plus_one_threshold=self.n_plus_one_threshold),
+        )
+        return set([result.fingerprint for result in results])
 
     @cached_property
     def base_results(self) -> Iterator[AnalysisResult]:
@@ -42,10 +113,26 @@ class Comparison:
         metadata = self.storage.get(f"{self.base_sha}/metadata")
 
         spans = parse_spans(span_data)
-        return analyze(spans, metadata=metadata)
+        return analyze(
+            spans,
+            metadata=metadata,
+            workers=self.workers,
+            n_plus_one_threshold=self.n_plus_one_threshold,
+        )
 
     @cached_property
-    def head_results(self) -> Iterator[AnalysisResult]:
+    def head_results(self) -> List[AnalysisResult]:
+        if self.head_analysis_results is not None:
+            return self.head_analysis_results
+
+        if self.head_span_data is None:
+            results = load_results(
+                self.storage.get(f"{self.head_sha}/results"),
+                n_plus_one_threshold=self.n_plus_one_threshold,
+            )
+            if results is not None:
+                return results
+
         span_data = self.head_span_data
         if span_data is None:
             span_data = self.storage.get(f"{self.head_sha}/spans")
@@ -57,14 +144,28 @@ class Comparison:
             metadata = self.storage.get(f"{self.head_sha}/metadata")
 
         spans = parse_spans(span_data)
-        return analyze(spans, metadata=metadata)
+        return list(
+            analyze(
+                spans,
+                metadata=metadata,
+                workers=self.workers,
+                n_plus_one_threshold=self.n_plus_one_threshold,
+            )
+        )
+
+    def prepare(self):
+        """
+        Loads (or analyzes) the base and head results up front, so that
+        `new_analysis_results` doesn't analyze anything.  Analysis can start
+        worker processes, which shouldn't be started from a thread pool.
+        """
+        self.base_fingerprints
+        self.head_results
 
     def new_analysis_results(self) -> Iterator[AnalysisResult]:
         """
         Returns analysis results that exist only in the head commit (and not in the base).
         """
-        base_fingerprints = set([result.fingerprint for result in self.base_results])
-
         for result in self.head_results:
-            if result.fingerprint not in base_fingerprints:
+            if result.fingerprint not in self.base_fingerprints:
                 yield result
@@ -1,43 +1,79 @@
-from typing import List
+import itertools
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple
+from typing import Dict, List, Optional
 from urllib.parse import urlparse
 
+from sqlcritic.database.cache import ExplainCache
 from sqlcritic.database.postgres import PostgresAdapter
 from sqlcritic.database.types import Index
 from sqlcritic.trace import Spans, SpanType
+from sqlcritic.utils import fingerprint
 
 
 class DatabaseConnection:
-    def __init__(self, db_url: str):
+    def __init__(self, db_url: str, workers: int = 1):
         self.db_url = db_url
+        # number of queries explained concurrently
+        self.workers = workers
         scheme = urlparse(self.db_url).scheme
         if scheme in ["postgres", "postgresql"]:
-            self.adapter = PostgresAdapter(self.db_url)
+            self.adapter = PostgresAdapter(self.db_url, workers=workers)
         else:
             # TODO: support other database types
             raise NotImplementedError(f"unsupported database type: {scheme}")
 
-    def explain(self, spans: Spans) -> dict:
-        results = {}
-
-        self.adapter.connect()
-
+    def explain(self, spans: Spans, cache: Optional[ExplainCache] = None) -> dict:
+        """
+        Explains every distinct `select` executed from a test.  Plans found in
+        the given cache are reused and newly explained plans are added to it.
+        """
+        # distinct queries in the order they were first executed
+        queries: Dict[str, None] = {}
         for span in spans:
             if span.span_type == SpanType.DB and span.name == "SELECT":
-                descends_from_test = any(
-                    [
-                        ancestor.span_type == SpanType.TEST
-                        for ancestor in spans.ancestors(span)
-                    ]
-                )
-                if descends_from_test:
+                if spans.descends_from_test(span):
                     # this span is a `select` query executed from a test
                     sql = span.sql
-                    if sql not in results:
-                        result = self.adapter.explain(sql)
-                        if result:
-                            results[sql] = result
+                    assert sql is not None
+                    queries[sql] = None
 
-        self.adapter.close()
+        plans: Dict[str, Optional[dict]] = {}
+        if cache is not None:
+            for sql in queries:
+                plan = cache.get(sql)
+                if plan is not None:
+                    plans[sql] = plan
+
+        # each batch is explained in its own session (a few batches per worker
+        # so that they stay busy when some queries are slower than others)
+        ordered = [sql for sql in queries if sql not in plans]
+        batch_size = max(1, math.ceil(len(ordered) / (self.workers * 4)))
+        batches = [
+            ordered[i : i + batch_size] for i in range(0, len(ordered), batch_size)
+        ]
+
+        self.adapter.connect()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                # results come back in query order regardless of completion order
+                explained = itertools.chain.from_iterable(
+                    executor.map(self.adapter.explain_many, batches)
+                )
+                for sql, plan in zip(ordered, explained):
+                    plans[sql] = plan
+                    if plan and cache is not None:
+                        cache.put(sql, plan)
+        finally:
+            self.adapter.close()
+
+        results = {}
+        for sql in queries:
+            plan = plans.get(sql)
+            if plan:
+                results[sql] = plan
         return results
 
     def indexes(self) -> List[Index]:
@@ -45,3 +81,19 @@ class DatabaseConnection:
         results = list(self.adapter.indexes())
         self.adapter.close()
         return results
+
+    def schema_fingerprint(self) -> str:
+        """
+        Fingerprint of the table definitions and indexes (i.e. whatever affects query plans).
+        """
+        self.adapter.connect()
+        try:
+            columns = self.adapter.columns()
+            indexes = sorted(self.adapter.indexes(), key=lambda index: astuple(index))
+        finally:
+            self.adapter.close()
+
+        return fingerprint(
+            *[json.dumps(column) for column in columns],
+            *[json.dumps(astuple(index)) for index in indexes],
+        )
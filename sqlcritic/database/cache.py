@@ -0,0 +1,59 @@
+from typing import Dict, Optional
+
+from sqlcritic.storage import Storage
+from sqlcritic.utils import fingerprint
+
+
+class ExplainCache:
+    """
+    Query plans from previous runs against the same database schema.
+
+    Plans are keyed by SQL fingerprint and stored as a single object per schema
+    fingerprint, so any schema change starts from an empty cache.  Only the
+    `max_entries` most recently used plans are kept.
+    """
+
+    def __init__(
+        self, storage: Storage, schema_fingerprint: str, max_entries: int = 10_000
+    ):
+        self.storage = storage
+        self.key = f"explain-cache/{schema_fingerprint}"
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        data = storage.get(self.key) or {}
+        # each entry is {"plan": ..., "used": <run in which it was last used>}
+        self.entries: Dict[str, dict] = data.get("entries", {})
+        self.run: int = data.get("run", 0) + 1
+
+    def get(self, sql: str) -> Optional[dict]:
+        entry = self.entries.get(fingerprint(sql))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry["used"] = self.run
+        return entry["plan"]
+
+    def put(self, sql: str, plan: dict):
+        self.entries[fingerprint(sql)] = {"plan": plan, "used": self.run}
+
+    def save(self):
+        if len(self.entries) > self.max_entries:
+            keep = sorted(
+                self.entries.items(), key=lambda item: item[1]["used"], reverse=True
+            )[: self.max_entries]
+            self.evictions += len(self.entries) - len(keep)
+            self.entries = dict(keep)
+
+        self.storage.put(self.key, {"run": self.run, "entries": self.entries})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+        }
@@ -1,7 +1,9 @@
 import re
-from typing import Iterator, Optional
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Tuple
 
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 
 from .types import Index
 
@@ -57,86 +59,187 @@ group by
 	index_name;
 """
 
+column_query = """
+select
+    table_schema,
+    table_name,
+    column_name,
+    data_type,
+    is_nullable
+from
+    information_schema.columns
+where
+    table_schema not in ('pg_catalog', 'information_schema')
+order by
+    table_schema,
+    table_name,
+    ordinal_position;
+"""
+
+# Postgres might not use an index when there's not much (no) data
+# TODO: what if a different schema is being used?
+session_settings = """
+SET enable_seqscan = OFF;
+SET search_path TO public;
+SET plan_cache_mode = force_generic_plan;
+"""
+
+
+class ExplainSession:
+    """
+    Explains a series of queries on a single connection.
+
+    The session settings are applied once and every query is explained in a
+    single round trip: a savepoint (so a failing query doesn't abort the
+    others), a uniquely named prepared statement and the `EXPLAIN` itself are
+    sent together, while cleanup of the previous query rides along with the next.
+    """
+
+    def __init__(self, connection: Any):
+        self.connection = connection
+        self._count = 0
+        # statements to send with the next query
+        self._pending = session_settings
+
+    def explain(self, query: str) -> Optional[dict]:
+        self._count += 1
+        statement = f"sqlcritic_{self._count}"
+
+        # replace '%s' placeholders with '$N' where N=1..
+        r = re.compile(r"\%s")
+        n = len(r.findall(query))
+
+        for i in range(1, n + 1):
+            query = query.replace("%s", f"${i}", 1)
+
+        # find the number of parameters in the query
+        r = re.compile(r"(\$\d+)")
+        n = len(r.findall(query))
+
+        # `unknown` type for each parameter
+        params = ""
+        args = ""
+        if n > 0:
+            params = "(" + ", ".join(["unknown"] * n) + ")"
+            args = "(" + ", ".join(["NULL"] * n) + ")"
+
+        query = query.strip().rstrip(";")
+        with self.connection.cursor() as cursor:
+            try:
+                # statements are separated by line breaks (and the query is
+                # terminated on its own line) in case it ends with a `--` comment
+                cursor.execute(
+                    "\n".join(
+                        [
+                            self._pending,
+                            "SAVEPOINT explain;",
+                            f"PREPARE {statement}{params} AS {query}\n;",
+                            f"EXPLAIN (FORMAT JSON) EXECUTE {statement}{args}",
+                        ]
+                    )
+                )
+                (res,) = cursor.fetchone()
+                self._pending = f"RELEASE SAVEPOINT explain; DEALLOCATE {statement};"
+                return res[0]
+            except psycopg2.Error as err:
+                if self._pending == session_settings:
+                    # nothing has been applied yet
+                    self.connection.rollback()
+                else:
+                    cursor.execute("ROLLBACK TO SAVEPOINT explain")
+                    self._pending = "RELEASE SAVEPOINT explain;"
+                if isinstance(err, psycopg2.errors.UndefinedTable):  # type: ignore
+                    return None
+                raise
+
+    def close(self):
+        """
+        Removes all prepared statements (they outlive transactions)
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute("DEALLOCATE ALL")
+
 
 class PostgresAdapter:
-    def __init__(self, db_url: str):
+    def __init__(self, db_url: str, workers: int = 1):
         self.db_url = db_url
+        # maximum number of connections used concurrently
+        self.workers = workers
+        self.pool: Optional[ThreadedConnectionPool] = None
 
     def connect(self):
-        self.connection = psycopg2.connect(self.db_url)
+        self.pool = ThreadedConnectionPool(1, self.workers, self.db_url)
 
-        with self.connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public';"
-            )
-            res = cursor.fetchall()
-            tables = [item[0] for item in res]
-            print(f"::debug::tables={tables}")
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public';"
+                )
+                res = cursor.fetchall()
+                tables = [item[0] for item in res]
+                print(f"::debug::tables={tables}")
 
     def close(self):
-        if self.connection:
-            self.connection.rollback()
-            self.connection.close()
-            self.connection = None
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
 
-    def explain(self, query: str) -> Optional[dict]:
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        Borrows a connection from the pool (safe to use from multiple threads).
+        """
+        assert self.pool is not None
+        connection = self.pool.getconn()
         try:
-            with self.connection.cursor() as cursor:
-                # Postgres might not use an index when there's not much (no) data
-                cursor.execute("SET enable_seqscan = OFF;")
-
-                # TODO: what if a different schema is being used?
-                cursor.execute("SET search_path TO public;")
-
-                # replace '%s' placeholders with '$N' where N=1..
-                r = re.compile(r"\%s")
-                n = len(r.findall(query))
-
-                for i in range(1, n + 1):
-                    query = query.replace("%s", f"${i}", 1)
-
-                # find the number of parameters in the query
-                r = re.compile(r"(\$\d+)")
-                n = len(r.findall(query))
-
-                # `unknown` type for each parameter
-                args = ", ".join(["unknown"] * n)
-
-                cursor.execute("SET plan_cache_mode = force_generic_plan;")
-
-                statement = "stmt"
-                if n > 0:
-                    statement = f"stmt({args})"
-                cursor.execute(f"PREPARE {statement} AS {query}")
-                nulls = ", ".join(["NULL"] * n)
-                if n > 0:
-                    statement = f"stmt({nulls})"
-                explain = f"EXPLAIN (FORMAT JSON) EXECUTE {statement}"
-                cursor.execute(explain)
-                (res,) = cursor.fetchone()
-                cursor.execute("DEALLOCATE stmt;")
-
-                return res[0]
-        except psycopg2.errors.UndefinedTable:  # type: ignore
-            return None
+            yield connection
         finally:
-            self.connection.rollback()
+            connection.rollback()
+            self.pool.putconn(connection)
+
+    def explain(self, query: str) -> Optional[dict]:
+        return self.explain_many([query])[0]
+
+    def explain_many(self, queries: List[str]) -> List[Optional[dict]]:
+        """
+        Explains the given queries (in order) in a single session on one connection.
+        """
+        with self.connection() as connection:
+            session = ExplainSession(connection)
+            try:
+                return [session.explain(query) for query in queries]
+            finally:
+                session.close()
 
     def indexes(self) -> Iterator[Index]:
         """
         Queries for a full list of indexes in the database.
         """
-        with self.connection.cursor() as cursor:
-            cursor.execute(index_query)
-
-            res = cursor.fetchall()
-            for schema_name, table_name, index_name, columns in res:
-                yield Index(
-                    schema_name=schema_name,
-                    table_name=table_name,
-                    index_name=index_name,
-                    columns=tuple([str(column) for column in columns.split(",")]),
-                )
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(index_query)
+                res = cursor.fetchall()
+
+        for schema_name, table_name, index_name, columns in res:
+            yield Index(
+                schema_name=schema_name,
+                table_name=table_name,
+                index_name=index_name,
+                columns=tuple([str(column) for column in columns.split(",")]),
+            )
+
+    def columns(self) -> List[Tuple[str, ...]]:
+        """
+        Queries for the column definitions of every table (used to detect schema changes).
+        """
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW server_version;")
+                (version,) = cursor.fetchone()
+                cursor.execute(column_query)
+                res = cursor.fetchall()
+
+        return [("server_version", version)] + [tuple(row) for row in res]
 
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 
 @dataclass(frozen=True)
@@ -11,4 +11,57 @@ class Index:
 
     def indexes_columns(self, column_names: List[str]) -> bool:
         n = len(column_names)
-        return self.columns[:n] == tuple(column_names)
+        return tuple(self.columns[:n]) == tuple(column_names)
+
+
+class IndexLookup:
+    """
+    Indexes keyed by (schema, table) for checking which column lists are
+    covered by the leading columns of an index.
+
+    Each table's indexes are stored as a trie of their columns so a lookup
+    costs O(columns) regardless of how many indexes there are.
+    """
+
+    def __init__(self, indexes: Iterable[Index]):
+        self._tries: Dict[Tuple[str, str], dict] = {}
+        self._schemas: Dict[str, List[str]] = {}
+
+        for index in indexes:
+            key = (index.schema_name, index.table_name)
+            if key not in self._tries:
+                self._tries[key] = {}
+                self._schemas.setdefault(index.table_name, []).append(index.schema_name)
+
+            node = self._tries[key]
+            for column in index.columns:
+                node = node.setdefault(column, {})
+
+    @classmethod
+    def from_metadata(cls, indexes: List[dict]) -> "IndexLookup":
+        return cls(Index(**index) for index in indexes)
+
+    def indexes_columns(
+        self,
+        table_name: str,
+        column_names: List[str],
+        schema_name: Optional[str] = None,
+    ) -> bool:
+        """
+        Returns whether some index on the table has the given columns as its
+        leading columns (any schema is considered unless one is given).
+        """
+        if schema_name is None:
+            schemas = self._schemas.get(table_name, [])
+        else:
+            schemas = [schema_name]
+
+        for schema in schemas:
+            node: Optional[dict] = self._tries.get((schema, table_name))
+            for column in column_names:
+                if node is None:
+                    break
+                node = node.get(column)
+            if node is not None:
+                return True
+        return False
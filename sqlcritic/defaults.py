@@ -0,0 +1,4 @@
+# minimum number of times a query must be repeated (following a source query) to
+# be reported as an N+1 - kept here so that the collector (which is imported by
+# the pytest plugin) doesn't need to import the analyzers
+N_PLUS_ONE_THRESHOLD = 2
@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from typing import List, Optional, Sequence, TextIO
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.trace import format_span_id, format_trace_id
+
+from sqlcritic.compact import SQL_ATTRIBUTE, CompactEncoder
+from sqlcritic.normalize import normalize_sql
+
+
+class NDJSONSpanExporter(SpanExporter):
+    """
+    Streams finished spans to a file as newline-delimited JSON.
+
+    At most `buffer_size` spans are held in memory - the buffer is written out
+    whenever it fills up or when `flush_interval` seconds have passed since the
+    last write, so memory use stays flat regardless of the number of spans.
+    If `normalize` is set then SQL statements are normalized before being written.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = 1000,
+        flush_interval: float = 5.0,
+        normalize: bool = False,
+    ):
+        self.path = path
+        self.normalize = normalize
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        self._file: Optional[TextIO] = open(path, "w")
+        self._last_flush = time.monotonic()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        with self._lock:
+            if self._file is None:
+                return SpanExportResult.FAILURE
+
+            for span in spans:
+                self._buffer.append(self._encode(span))
+
+            if (
+                len(self._buffer) >= self.buffer_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush()
+
+        return SpanExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._file = None
+
+    def _encode(self, span: ReadableSpan) -> str:
+        line = span.to_json(indent=None)
+        if self.normalize and span.attributes and SQL_ATTRIBUTE in span.attributes:
+            data = json.loads(line)
+            data["attributes"][SQL_ATTRIBUTE] = normalize_sql(
+                data["attributes"][SQL_ATTRIBUTE]
+            )
+            line = json.dumps(data)
+        return line
+
+    def _flush(self):
+        assert self._file is not None
+        if self._buffer:
+            self._file.write("\n".join(self._buffer))
+            self._file.write("\n")
+            self._buffer = []
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+
+def encode_span(encoder: CompactEncoder, span: ReadableSpan):
+    """
+    Adds a finished span to the compact results format without going through JSON.
+    """
+    context = span.get_span_context()
+    assert context is not None
+    parent_id = None
+    if span.parent is not None:
+        parent_id = f"0x{format_span_id(span.parent.span_id)}"
+
+    encoder.add(
+        name=span.name,
+        trace_id=f"0x{format_trace_id(context.trace_id)}",
+        span_id=f"0x{format_span_id(context.span_id)}",
+        parent_id=parent_id,
+        start_time=span.start_time or 0,
+        end_time=span.end_time or 0,
+        attributes=span.attributes or {},
+    )
@@ -1,19 +1,32 @@
 from functools import cached_property
 from typing import List, Optional
 
-from github import Auth, Github
+from github import Auth, Github, GithubException
 from github.Issue import Issue
 from github.IssueComment import IssueComment
 from github.PullRequest import PullRequest
 from github.Repository import Repository
 
+from sqlcritic.storage import Storage
+
 
 class Pull:
     comment_marker = "<!--- comment made by sqlcritic --->"
 
-    def __init__(self, repo: Repository, number: int):
+    def __init__(
+        self,
+        repo: Repository,
+        number: int,
+        pr: Optional[PullRequest] = None,
+        storage: Optional[Storage] = None,
+    ):
         self.repo = repo
         self.number = number
+        if pr is not None:
+            # already fetched (i.e. when listing PRs) so no need to fetch it again
+            self.pr = pr
+        # used to remember the bot comment between runs
+        self.storage = storage
 
     @cached_property
     def pr(self) -> PullRequest:
@@ -44,26 +57,59 @@ class Pull:
         content = "\n".join(lines)
         comment_body = f"{content}\n\n{self.comment_marker}"
 
-        existing_comment = self.bot_comment()
-        if existing_comment is not None:
+        state = self.storage.get(self._comment_key) if self.storage else None
+
+        existing_comment = None
+        if state is not None:
+            # the remembered comment may have been deleted or edited since
+            existing_comment = self._get_comment(state["id"])
+        if existing_comment is None:
+            existing_comment = self.bot_comment()
+
+        if existing_comment is None:
+            existing_comment = self.issue.create_comment(comment_body)
+        elif existing_comment.body != comment_body:
             existing_comment.edit(comment_body)
         else:
-            issue = self.repo.get_issue(self.number)
-            issue.create_comment(comment_body)
+            print(f"::debug::unchanged comment={existing_comment.id}")
+
+        # only the comment id is remembered (its body is always checked since
+        # the comment may have been edited)
+        new_state = {"id": existing_comment.id}
+        if self.storage is not None and state != new_state:
+            self.storage.put(self._comment_key, new_state)
+
+    @property
+    def _comment_key(self) -> str:
+        return f"comments/{self.repo.full_name}/{self.number}"
+
+    def _get_comment(self, comment_id: int) -> Optional[IssueComment]:
+        try:
+            return self.issue.get_comment(comment_id)
+        except GithubException as err:
+            if err.status == 404:
+                # the comment was deleted
+                return None
+            raise err
 
 
 class Repo:
-    def __init__(self, repo_slug: str, token: str):
+    def __init__(self, repo_slug: str, token: str, storage: Optional[Storage] = None):
         self.repo_slug = repo_slug
         self.github = Github(auth=Auth.Token(token))
+        self.storage = storage
 
     @cached_property
     def _repo(self):
         return self.github.get_repo(self.repo_slug)
 
     def pull(self, number: int) -> Pull:
-        return Pull(self._repo, number)
+        return Pull(self._repo, number, storage=self.storage)
 
     def pulls(self, commit_sha: str) -> List[Pull]:
         commit = self._repo.get_commit(commit_sha)
-        return [self.pull(pull.number) for pull in commit.get_pulls()]
+        # the listing includes the base and head of each PR
+        return [
+            Pull(self._repo, pr.number, pr=pr, storage=self.storage)
+            for pr in commit.get_pulls()
+        ]
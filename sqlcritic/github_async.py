@@ -0,0 +1,244 @@
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+import aiohttp
+
+from sqlcritic.github import Pull
+from sqlcritic.storage import Storage
+
+GITHUB_API_URL = "https://api.github.com"
+
+
+class GitHubClient:
+    """
+    Minimal asyncio GitHub REST client.
+
+    Requests that are rate limited (or fail with a server error) are retried
+    after waiting as long as the rate limit headers ask for, or with exponential
+    backoff otherwise.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = GITHUB_API_URL,
+        max_retries: int = 5,
+        max_wait: float = 60.0,
+    ):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        # longest time to wait before a retry
+        self.max_wait = max_wait
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "GitHubClient":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers={
+                    "Authorization": f"token {self.token}",
+                    "Accept": "application/vnd.github+json",
+                }
+            )
+        return self._session
+
+    async def request(self, method: str, path: str, json: Any = None) -> Any:
+        data, _ = await self._request(method, self._url(path), json=json)
+        return data
+
+    async def paginate(self, path: str) -> AsyncIterator[Any]:
+        """
+        Yields the items of every page of a list endpoint.
+        """
+        url: Optional[str] = self._url(path)
+        while url is not None:
+            items, headers = await self._request("GET", url)
+            for item in items:
+                yield item
+            url = _next_link(headers.get("Link"))
+
+    async def _request(self, method: str, url: str, json: Any = None):
+        attempt = 0
+        while True:
+            async with self.session.request(method, url, json=json) as res:
+                wait = self._retry_wait(res, attempt)
+                if wait is None:
+                    res.raise_for_status()
+                    data = await res.json() if res.status != 204 else None
+                    return data, res.headers
+
+            attempt += 1
+            print(f"::debug::github retry={attempt} wait={wait:.1f} url={url}")
+            await asyncio.sleep(wait)
+
+    def _retry_wait(self, res: aiohttp.ClientResponse, attempt: int) -> Optional[float]:
+        """
+        Returns how long to wait before retrying the request (or `None` if it
+        shouldn't be retried).
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        if res.status in (403, 429):
+            if "Retry-After" in res.headers:
+                # secondary rate limit
+                wait = float(res.headers["Retry-After"])
+            elif res.headers.get("X-RateLimit-Remaining") == "0":
+                # primary rate limit - wait until the limit resets
+                reset = float(res.headers.get("X-RateLimit-Reset", 0))
+                wait = max(reset - time.time(), 0) + 1
+            else:
+                # forbidden for some other reason
+                return None
+        elif res.status >= 500:
+            wait = 2**attempt
+        else:
+            return None
+
+        return min(wait, self.max_wait)
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+
+def _next_link(header: Optional[str]) -> Optional[str]:
+    if not header:
+        return None
+    match = re.search(r'<([^>]+)>;\s*rel="next"', header)
+    return match.group(1) if match else None
+
+
+class AsyncPull:
+    """
+    The asyncio equivalent of `sqlcritic.github.Pull`.
+    """
+
+    comment_marker = Pull.comment_marker
+
+    def __init__(
+        self,
+        client: GitHubClient,
+        repo_slug: str,
+        data: dict,
+        storage: Optional[Storage] = None,
+    ):
+        self.client = client
+        self.repo_slug = repo_slug
+        self.number: int = data["number"]
+        self.base_sha: str = data["base"]["sha"]
+        self.head_sha: str = data["head"]["sha"]
+        # used to remember the bot comment between runs
+        self.storage = storage
+
+    async def bot_comment(self) -> Optional[dict]:
+        # search for existing comment by this bot
+        comments = self.client.paginate(
+            f"repos/{self.repo_slug}/issues/{self.number}/comments?per_page=100"
+        )
+        async for comment in comments:
+            if self.comment_marker in comment["body"]:
+                return comment
+        return None
+
+    async def comment(self, lines: List[str]):
+        content = "\n".join(lines)
+        comment_body = f"{content}\n\n{self.comment_marker}"
+
+        state = None
+        if self.storage is not None:
+            state = await asyncio.to_thread(self.storage.get, self._comment_key)
+
+        existing_comment = None
+        if state is not None:
+            # the remembered comment may have been deleted or edited since
+            existing_comment = await self._get_comment(state["id"])
+        if existing_comment is None:
+            existing_comment = await self.bot_comment()
+
+        if existing_comment is None:
+            existing_comment = await self.client.request(
+                "POST",
+                f"repos/{self.repo_slug}/issues/{self.number}/comments",
+                json={"body": comment_body},
+            )
+        elif existing_comment["body"] != comment_body:
+            await self.client.request(
+                "PATCH",
+                f"repos/{self.repo_slug}/issues/comments/{existing_comment['id']}",
+                json={"body": comment_body},
+            )
+        else:
+            print(f"::debug::unchanged comment={existing_comment['id']}")
+
+        # only the comment id is remembered (its body is always checked since
+        # the comment may have been edited)
+        new_state = {"id": existing_comment["id"]}
+        if self.storage is not None and state != new_state:
+            await asyncio.to_thread(self.storage.put, self._comment_key, new_state)
+
+    @property
+    def _comment_key(self) -> str:
+        return f"comments/{self.repo_slug}/{self.number}"
+
+    async def _get_comment(self, comment_id: int) -> Optional[dict]:
+        try:
+            return await self.client.request(
+                "GET", f"repos/{self.repo_slug}/issues/comments/{comment_id}"
+            )
+        except aiohttp.ClientResponseError as err:
+            if err.status == 404:
+                # the comment was deleted
+                return None
+            raise err
+
+
+class AsyncRepo:
+    """
+    The asyncio equivalent of `sqlcritic.github.Repo`.
+    """
+
+    def __init__(
+        self,
+        repo_slug: str,
+        token: str,
+        storage: Optional[Storage] = None,
+        base_url: str = GITHUB_API_URL,
+    ):
+        self.repo_slug = repo_slug
+        self.client = GitHubClient(token, base_url=base_url)
+        self.storage = storage
+
+    async def __aenter__(self) -> "AsyncRepo":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.client.close()
+
+    async def pull(self, number: int) -> AsyncPull:
+        data = await self.client.request(
+            "GET", f"repos/{self.repo_slug}/pulls/{number}"
+        )
+        return AsyncPull(self.client, self.repo_slug, data, storage=self.storage)
+
+    async def pulls(self, commit_sha: str) -> List[AsyncPull]:
+        # the listing includes the base and head of each PR
+        return [
+            AsyncPull(self.client, self.repo_slug, data, storage=self.storage)
+            async for data in self.client.paginate(
+                f"repos/{self.repo_slug}/commits/{commit_sha}/pulls?per_page=100"
+            )
+        ]
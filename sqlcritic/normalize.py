@@ -0,0 +1,45 @@
+import re
+from functools import lru_cache
+
+PLACEHOLDER = "%s"
+
+# quoted identifiers, typed literals (i.e. `interval '1 day'`) and type modifiers
+# (i.e. `::numeric(10, 2)`), none of which can be parameterized, are matched (and
+# kept) so that their contents are skipped
+_tokens = re.compile(
+    r"""
+    (?P<identifier>"(?:[^"]|"")*")
+    | (?P<typed>\b(?i:date|time|timestamp|timestamptz|interval)(?:\s*\(\s*\d+\s*\))?
+        (?i:\s+with(?:out)?\s+time\s+zone)?\s*'(?:[^']|'')*')  # typed literal
+    | (?P<modifier>(?:::\s*\w+(?i:\s+varying)?
+        | \b(?i:numeric|decimal|dec|varchar|char|character(?:\s+varying)?
+            |bit(?:\s+varying)?|varbit|float|time|timestamp|timestamptz|interval))
+        \s*\(\s*\d+(?:\s*,\s*\d+)?\s*\))                         # type modifier
+    | (?<![\w$])[eE]'(?:[^'\\]|\\.|'')*'                  # escape string
+    | (?:(?<![\w$])(?:[bBxXnN]|[uU]&))?'(?:[^']|'')*'      # string literal
+    | \$(?P<tag>(?:[A-Za-z_]\w*)?)\$[\s\S]*?\$(?P=tag)\$     # dollar-quoted string
+    | \$\d+                                                 # numbered placeholder
+    | %s                                                    # format placeholder
+    | (?<![\w$])(?:\d+(?:\.\d+)?|\.\d+)(?:[eE][-+]?\d+)?\b  # numeric literal
+    """,
+    re.VERBOSE,
+)
+
+_in_list = re.compile(r"\bIN\s*\(\s*%s(?:\s*,\s*%s)*\s*\)", re.IGNORECASE)
+
+
+def _replace(match: re.Match) -> str:
+    if match.lastgroup in ("identifier", "typed", "modifier"):
+        return match.group(0)
+    return PLACEHOLDER
+
+
+@lru_cache(maxsize=65536)
+def normalize_sql(sql: str) -> str:
+    """
+    Replaces literals and placeholders (`$N` or `%s`) with `%s` and collapses
+    `IN (...)` lists to a single placeholder, so that statements which only
+    differ by their parameters are the same.
+    """
+    sql = _tokens.sub(_replace, sql)
+    return _in_list.sub(f"IN ({PLACEHOLDER})", sql)
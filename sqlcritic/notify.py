@@ -1,9 +1,13 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Iterator, List
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Union
 
 from .analyze import AnalysisResult, AnalysisType
 from .github import Pull
 
+if TYPE_CHECKING:
+    from .github_async import AsyncPull
+
 
 class Notifier(ABC):
     @abstractmethod
@@ -12,13 +16,24 @@ class Notifier(ABC):
 
 
 class GitHubNotifier(Notifier):
-    def __init__(self, pull: Pull):
+    def __init__(self, pull: Union[Pull, "AsyncPull"]):
         self.pull = pull
 
     def notify(self, results: Iterator[AnalysisResult]):
         lines = self.format(results)
         self.pull.comment(lines)
 
+    async def notify_async(self, results: Iterator[AnalysisResult]):
+        """
+        Like `notify` but awaits the comment when the pull is an `AsyncPull`
+        (a `Pull` comments from another thread so the event loop isn't blocked).
+        """
+        lines = self.format(results)
+        if isinstance(self.pull, Pull):
+            await asyncio.to_thread(self.pull.comment, lines)
+        else:
+            await self.pull.comment(lines)
+
     def format(self, results: Iterator[AnalysisResult]) -> List[str]:
         lines = [
             f"> Comparing {self.pull.head_sha} (head) with {self.pull.base_sha} (base)",
@@ -33,7 +48,7 @@ class GitHubNotifier(Notifier):
                     "```sql",
                     "--- source query",
                     result.queries[0],
-                    "--- N query",
+                    self._n_query_label(result),
                     result.queries[1],
                     "```",
                 ] + self._source_lines(result)
@@ -91,6 +106,11 @@ class GitHubNotifier(Notifier):
         ]
         return lines
 
+    def _n_query_label(self, result: AnalysisResult) -> str:
+        if result.extra and "count" in result.extra:
+            return f"--- N query (executed {result.extra['count']} times)"
+        return "--- N query"
+
     def _column_names(self, data: Dict[str, Any]) -> List[str]:
         lines = []
         for table_name, column_names in data.items():
@@ -0,0 +1,169 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+import sqlglot
+from sqlglot import exp, parse_one
+
+from sqlcritic.normalize import normalize_sql
+from sqlcritic.utils import fingerprint
+
+
+@dataclass
+class ParsedQuery:
+    # table names by alias (un-aliased tables map to themselves)
+    table_aliases: Dict[str, str]
+    # for each `where` clause, the columns it references grouped by table
+    where_columns: List[Dict[str, List[str]]]
+
+
+def parse_query(sql: str) -> ParsedQuery:
+    # replace '%s' placeholders with '$N' where N=1..
+    r = re.compile(r"\%s")
+    n = len(r.findall(sql))
+    for i in range(1, n + 1):
+        sql = sql.replace("%s", f"${i}", 1)
+
+    ast = parse_one(sql)
+
+    # collect all table aliases
+    table_aliases = {}
+    for node in ast.find_all(exp.From):
+        table_aliases[node.alias_or_name] = node.name
+    for join in ast.find_all(exp.Join):
+        tables = join.find_all(exp.Table)
+        for table in tables:
+            table_aliases[table.alias_or_name] = table.name
+
+    # TODO: do something similar for `order by`
+    where_columns = []
+    for where in ast.find_all(exp.Where):
+        columns = where.find_all(exp.Column)
+
+        # group columns by table - if there are multiple tables
+        # then the database will scan each index and create bitmaps
+        # that are combined together
+        by_table = defaultdict(list)
+        for column in columns:
+            table_name = table_aliases.get(column.table) or column.table
+            if not table_name:
+                continue
+            by_table[table_name].append(column.name)
+        where_columns.append(dict(by_table))
+
+    return ParsedQuery(table_aliases=table_aliases, where_columns=where_columns)
+
+
+class QueryCache:
+    """
+    Memoizes `parse_query` for the most recently used `maxsize` statements.
+    Statements are normalized first (see `sqlcritic.normalize`), so statements
+    that only differ by their literals are parsed (and stored) once.
+
+    If opened on a directory then parsed queries are also persisted there (keyed
+    by the SQL fingerprint and the sqlglot version) so they can be reused across runs.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.path: Optional[str] = None
+        self._entries: OrderedDict[str, ParsedQuery] = OrderedDict()
+        self._stored: Dict[str, dict] = {}
+        self._used: Dict[str, dict] = {}
+        # whether the queries used are recorded (to be persisted)
+        self._tracking = False
+        self._lock = threading.Lock()
+
+    def get(self, sql: str) -> ParsedQuery:
+        sql = normalize_sql(sql)
+        with self._lock:
+            parsed = self._entries.get(sql)
+            if parsed is not None:
+                self._entries.move_to_end(sql)
+                return parsed
+
+        key = fingerprint(sql)
+        stored = self._stored.get(key)
+        if stored is not None:
+            parsed = ParsedQuery(**stored)
+        else:
+            parsed = parse_query(sql)
+            stored = asdict(parsed)
+
+        with self._lock:
+            if self._tracking:
+                self._used[key] = stored
+            self._entries[sql] = parsed
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return parsed
+
+    def open(self, directory: str):
+        """
+        Loads previously persisted queries from the given directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(
+            directory, f"queries-sqlglot-{sqlglot.__version__}.json"
+        )
+        self._tracking = True
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self._stored = json.load(f)
+
+    def stored(self) -> Dict[str, dict]:
+        """
+        Returns the persisted queries (to be loaded into worker processes).
+        """
+        return self._stored
+
+    def load(self, stored: Dict[str, dict]):
+        """
+        Uses queries persisted by another cache and records the queries used
+        (so they can be collected with `take_used`).
+        """
+        self._stored = stored
+        self._tracking = True
+
+    def take_used(self) -> Dict[str, dict]:
+        """
+        Returns (and forgets) the queries used since the last call.
+        """
+        with self._lock:
+            used = self._used
+            self._used = {}
+        return used
+
+    def add_used(self, used: Dict[str, dict]):
+        """
+        Records queries used elsewhere (i.e. in worker processes) so they're persisted.
+        """
+        if not self._tracking:
+            return
+        with self._lock:
+            self._used.update(used)
+
+    def clear(self):
+        """
+        Forgets the queries parsed so far (persisted queries are kept).
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def save(self):
+        """
+        Persists the queries used since the cache was opened (older entries are dropped).
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            data = dict(self._used)
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+
+
+query_cache = QueryCache()
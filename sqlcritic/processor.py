@@ -0,0 +1,159 @@
+import time
+from typing import Dict, Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import SpanContext
+
+from sqlcritic.compact import SQL_ATTRIBUTE
+from sqlcritic.defaults import N_PLUS_ONE_THRESHOLD
+from sqlcritic.normalize import normalize_sql
+
+
+class FilteringSpanProcessor(SpanProcessor):
+    """
+    Drops spans that aren't needed for analysis before they reach `processor`.
+
+    - `db_and_tests_only`: only DB and test spans are kept and each DB span is
+      reparented to the test it ran in (so N+1 queries are grouped by test rather
+      than by any intermediate span).
+    - `tests_only`: spans that weren't started within a test are dropped.
+    - `max_repeats`: only the first `max_repeats` executions of an identical
+      statement within a test are kept (compared after normalizing them if
+      `normalize` is set).  N+1 counts are then capped at `max_repeats`, so it
+      can't be lower than the N+1 threshold the spans will be analyzed with
+      (`n_plus_one_threshold`, otherwise N+1 queries would never be found).
+      The number of executions dropped is kept in `dropped_repeats`.
+
+    Test spans must have their test attributes set when they're started.
+    """
+
+    def __init__(
+        self,
+        processor: SpanProcessor,
+        db_and_tests_only: bool = False,
+        tests_only: bool = False,
+        max_repeats: Optional[int] = None,
+        normalize: bool = False,
+        n_plus_one_threshold: Optional[int] = None,
+    ):
+        threshold = n_plus_one_threshold or N_PLUS_ONE_THRESHOLD
+        if max_repeats is not None and max_repeats < threshold:
+            raise ValueError(
+                f"max_repeats must be at least {threshold} (the N+1 threshold)"
+            )
+        self.processor = processor
+        self.db_and_tests_only = db_and_tests_only
+        self.tests_only = tests_only
+        self.max_repeats = max_repeats
+        self.normalize = normalize
+        self.dropped = 0
+        self.dropped_repeats = 0
+        # the test (if any) that each unfinished span was started within
+        self._tests: Dict[int, Optional[SpanContext]] = {}
+        # the number of times each statement has been executed by each unfinished test
+        self._repeats: Dict[int, Dict[str, int]] = {}
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        context = span.get_span_context()
+        assert context is not None
+        if span.attributes and "test.name" in span.attributes:
+            test: Optional[SpanContext] = context
+            self._repeats[context.span_id] = {}
+        elif span.parent is not None:
+            test = self._tests.get(span.parent.span_id)
+        else:
+            test = None
+        self._tests[context.span_id] = test
+        self.processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan):
+        context = span.get_span_context()
+        assert context is not None
+        test = self._tests.pop(context.span_id, None)
+        attributes = span.attributes or {}
+
+        if test is not None and test.span_id == context.span_id:
+            self._repeats.pop(context.span_id, None)
+            self.processor.on_end(span)
+            return
+
+        if test is None and self.tests_only:
+            self.dropped += 1
+            return
+
+        sql = attributes.get(SQL_ATTRIBUTE)
+        if sql is None:
+            if self.db_and_tests_only:
+                self.dropped += 1
+            else:
+                self.processor.on_end(span)
+            return
+
+        assert isinstance(sql, str)
+        if self.max_repeats is not None and test is not None:
+            repeats = self._repeats.get(test.span_id)
+            if repeats is not None:
+                if self.normalize:
+                    sql = normalize_sql(sql)
+                count = repeats[sql] = repeats.get(sql, 0) + 1
+                if count > self.max_repeats:
+                    self.dropped += 1
+                    self.dropped_repeats += 1
+                    return
+
+        if self.db_and_tests_only and span.parent != test:
+            span = _reparent(span, test)
+        self.processor.on_end(span)
+
+    def shutdown(self):
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.processor.force_flush(timeout_millis)
+
+
+def _reparent(span: ReadableSpan, parent: Optional[SpanContext]) -> ReadableSpan:
+    return ReadableSpan(
+        name=span.name,
+        context=span.get_span_context(),
+        parent=parent,
+        resource=span.resource,
+        attributes=span.attributes,
+        events=span.events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope,
+    )
+
+
+class TimedSpanProcessor(SpanProcessor):
+    """
+    Totals the time spent in `processor` as spans start and end (i.e. the
+    overhead added to each traced query).
+    """
+
+    def __init__(self, processor: SpanProcessor):
+        self.processor = processor
+        self.seconds = 0.0
+        self.spans = 0
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        start = time.perf_counter()
+        self.processor.on_start(span, parent_context=parent_context)
+        self.seconds += time.perf_counter() - start
+
+    def on_end(self, span: ReadableSpan):
+        start = time.perf_counter()
+        self.processor.on_end(span)
+        self.seconds += time.perf_counter() - start
+        self.spans += 1
+
+    def shutdown(self):
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.processor.force_flush(timeout_millis)
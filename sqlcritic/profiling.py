@@ -0,0 +1,235 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # not available on Windows
+    resource = None  # type: ignore
+
+PROFILE_MODES = ("stats", "cprofile", "pyinstrument")
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process so far (in bytes).
+    """
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux but bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def current_rss() -> int:
+    """
+    Returns the resident set size of this process (in bytes), or the peak RSS
+    where the current RSS isn't available (i.e. on macOS).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def cpu_time() -> float:
+    """
+    Returns the CPU time of this process and of its child processes that have
+    finished (i.e. analysis workers once their pool is shut down).
+    """
+    cpu = time.process_time()
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += usage.ru_utime + usage.ru_stime
+    return cpu
+
+
+@dataclass
+class StageStats:
+    name: str
+    # seconds (CPU time includes other threads and finished child processes,
+    # so stages that overlap count each other's CPU time)
+    wall: float = 0.0
+    cpu: float = 0.0
+    # change in the process's RSS (in bytes) over the stage, totalled across
+    # calls (negative when memory was released)
+    rss_delta: int = 0
+    # number of items (spans, queries, etc.) processed
+    count: int = 0
+    calls: int = 0
+
+
+class Timer:
+    """
+    Wraps a function that is called once per item (i.e. `Analyzer.visit`) and
+    totals the time spent in it.
+    """
+
+    def __init__(self, fn: Callable[[Any], None]):
+        self.fn = fn
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.count = 0
+
+    def __call__(self, item: Any):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self.fn(item)
+        self.wall += time.perf_counter() - wall
+        self.cpu += time.process_time() - cpu
+        self.count += 1
+
+
+class Profiler:
+    """
+    Records wall time, CPU time, RSS change and item counts for each stage of a run.
+
+    Does nothing until enabled.  Analyzers are timed individually (as
+    `analyze.<name>` stages) when analysis runs in this process.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+        self._dump: Optional[Any] = None
+        self._dump_mode: Optional[str] = None
+
+    def enable(self):
+        self.enabled = True
+
+    @contextmanager
+    def stage(self, name: str, count: int = 0) -> Iterator[StageStats]:
+        """
+        Times the enclosed block (the yielded stats can be used to set the count
+        once it's known).
+        """
+        stats = StageStats(name, count=count)
+        if not self.enabled:
+            yield stats
+            return
+
+        wall = time.perf_counter()
+        cpu = cpu_time()
+        rss = current_rss()
+        try:
+            yield stats
+        finally:
+            self.record(
+                name,
+                wall=time.perf_counter() - wall,
+                cpu=cpu_time() - cpu,
+                rss_delta=current_rss() - rss,
+                count=stats.count,
+            )
+
+    def record(
+        self,
+        name: str,
+        wall: float,
+        cpu: float,
+        rss_delta: int = 0,
+        count: int = 0,
+        calls: int = 1,
+    ):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats(name)
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.rss_delta += rss_delta
+            stats.count += count
+            stats.calls += calls
+
+    def start_dump(self, mode: str):
+        """
+        Starts a full profile of this process (`cprofile` or `pyinstrument`).
+        """
+        if mode == "cprofile":
+            import cProfile
+
+            self._dump = cProfile.Profile()
+            self._dump.enable()
+        elif mode == "pyinstrument":
+            from pyinstrument import Profiler as Pyinstrument  # type: ignore
+
+            self._dump = Pyinstrument()
+            self._dump.start()
+        self._dump_mode = mode
+
+    def stop_dump(self, directory: str) -> Optional[str]:
+        """
+        Stops the full profile and writes it to the given directory.
+        """
+        if self._dump is None:
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        if self._dump_mode == "cprofile":
+            self._dump.disable()
+            path = os.path.join(directory, "sqlcritic.prof")
+            self._dump.dump_stats(path)
+        else:
+            self._dump.stop()
+            path = os.path.join(directory, "sqlcritic-profile.html")
+            with open(path, "w") as f:
+                f.write(self._dump.output_html())
+        self._dump = None
+        return path
+
+    def results(self) -> List[dict]:
+        with self._lock:
+            return [asdict(stats) for stats in self.stages.values()]
+
+    def report(self, directory: str):
+        """
+        Outputs the recorded stages as debug lines, a job summary (when running
+        in GitHub Actions) and a JSON file in the given directory.
+        """
+        results = self.results()
+
+        for stats in results:
+            print(
+                f"::debug::stage={stats['name']} wall={stats['wall']:.3f}s "
+                f"cpu={stats['cpu']:.3f}s rss_delta={_mib(stats['rss_delta'])} "
+                f"count={stats['count']} calls={stats['calls']}"
+            )
+
+        summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
+        if summary_path:
+            with open(summary_path, "a") as f:
+                f.write("\n".join(self.summary(results)) + "\n")
+
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "sqlcritic-profile.json"), "w") as f:
+            json.dump({"stages": results}, f, indent=2)
+
+    def summary(self, results: List[dict]) -> List[str]:
+        lines = [
+            "### sql-critic stages",
+            "",
+            "| Stage | Wall (s) | CPU (s) | RSS change | Count | Calls |",
+            "| --- | ---: | ---: | ---: | ---: | ---: |",
+        ]
+        for stats in results:
+            lines.append(
+                f"| {stats['name']} | {stats['wall']:.3f} | {stats['cpu']:.3f} | "
+                f"{_mib(stats['rss_delta'])} | {stats['count']} | {stats['calls']} |"
+            )
+        return lines
+
+
+def _mib(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}MiB"
+
+
+profiler = Profiler()
@@ -0,0 +1,195 @@
+"""
+Collects queries made during a pytest run (enabled with `--sqlcritic-output`).
+
+Registered through the `pytest11` entry point so no conftest boilerplate is
+needed.  Database adapters still need to be instrumented (see the README).
+"""
+
+import time
+
+import pytest
+
+from sqlcritic.collector import Collector
+from sqlcritic.processor import TimedSpanProcessor
+from sqlcritic.utils import is_ndjson
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("sqlcritic", "sql-critic query collection")
+    group.addoption(
+        "--sqlcritic-output",
+        help="collect queries and write them to this path",
+    )
+    group.addoption(
+        "--sqlcritic-stream",
+        action="store_true",
+        help="write spans to the output as they finish (.ndjson or compact output)",
+    )
+    group.addoption(
+        "--sqlcritic-compact",
+        action="store_true",
+        help="write the compact columnar format",
+    )
+    group.addoption(
+        "--sqlcritic-sharded",
+        action="store_true",
+        help="write a file per process (always the case under pytest-xdist)",
+    )
+    group.addoption(
+        "--sqlcritic-normalize",
+        action="store_true",
+        help="replace literals and placeholders in SQL",
+    )
+    group.addoption(
+        "--sqlcritic-batch",
+        action="store_true",
+        help="export spans from a background thread",
+    )
+    group.addoption(
+        "--sqlcritic-db-and-tests-only",
+        action="store_true",
+        help="only keep DB and test spans",
+    )
+    group.addoption(
+        "--sqlcritic-tests-only",
+        action="store_true",
+        help="drop spans that aren't within a test",
+    )
+    group.addoption(
+        "--sqlcritic-max-repeats",
+        type=int,
+        help="only keep this many executions of an identical statement per test",
+    )
+    group.addoption(
+        "--sqlcritic-n-plus-one-threshold",
+        type=int,
+        help="the action's n-plus-one-threshold (the lowest allowed max repeats)",
+    )
+    parser.addini("sqlcritic_output", "collect queries and write them to this path")
+
+
+def pytest_configure(config):
+    output = config.getoption("sqlcritic_output") or config.getini("sqlcritic_output")
+    if not output:
+        return
+
+    worker = hasattr(config, "workerinput")
+    if not worker and config.getoption("dist", "no") != "no":
+        # the pytest-xdist controller doesn't run any tests (it only reports
+        # the totals sent by the workers)
+        config.pluginmanager.register(SQLCriticController(), "sqlcritic-controller")
+        return
+
+    compact = config.getoption("sqlcritic_compact")
+    stream = config.getoption("sqlcritic_stream")
+    if stream and not compact and not is_ndjson(output):
+        raise pytest.UsageError(
+            "--sqlcritic-stream requires an .ndjson output or --sqlcritic-compact"
+        )
+
+    collector = Collector(
+        stream_path=_stream_path(output, compact) if stream else None,
+        normalize_sql=config.getoption("sqlcritic_normalize"),
+        batch=config.getoption("sqlcritic_batch"),
+        db_and_tests_only=config.getoption("sqlcritic_db_and_tests_only"),
+        tests_only=config.getoption("sqlcritic_tests_only"),
+        max_repeats=config.getoption("sqlcritic_max_repeats"),
+        n_plus_one_threshold=config.getoption("sqlcritic_n_plus_one_threshold"),
+        sharded=worker or config.getoption("sqlcritic_sharded"),
+        timed=True,
+        root=str(config.invocation_params.dir),
+    )
+    plugin = SQLCriticPlugin(collector, output, compact=compact)
+    config.pluginmanager.register(plugin, "sqlcritic-collector")
+
+
+def _stream_path(output: str, compact: bool) -> str:
+    # compact output is encoded from the stream once the session finishes
+    return f"{output}.ndjson" if compact else output
+
+
+class SQLCriticPlugin:
+    def __init__(self, collector: Collector, output: str, compact: bool = False):
+        assert isinstance(collector.processor, TimedSpanProcessor)
+        self.collector = collector
+        self.processor = collector.processor
+        self.output = output
+        self.compact = compact
+        # time spent tracing tests (including processing the spans made by them)
+        # and saving the results
+        self.seconds = 0.0
+        self.tests = 0
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        start = time.perf_counter()
+        path, line, name = item.reportinfo()
+        with self.collector.trace_test(str(path), line or 0, name):
+            processing = self.processor.seconds
+            self.seconds += time.perf_counter() - start
+            yield
+            self.seconds += self.processor.seconds - processing
+            start = time.perf_counter()
+        self.seconds += time.perf_counter() - start
+        self.tests += 1
+
+    def pytest_sessionfinish(self, session):
+        start = time.perf_counter()
+        self.collector.save_results(self.output, compact=self.compact)
+        self.seconds += time.perf_counter() - start
+
+        workeroutput = getattr(session.config, "workeroutput", None)
+        if workeroutput is not None:
+            # worker output isn't shown so the totals are sent to the controller
+            workeroutput["sqlcritic"] = {
+                "tests": self.tests,
+                "spans": self.processor.spans,
+                "seconds": self.seconds,
+            }
+
+    def pytest_terminal_summary(self, terminalreporter):
+        _summary(terminalreporter, self.tests, self.processor.spans, self.seconds)
+
+
+class SQLCriticController:
+    """
+    Reports the totals of every pytest-xdist worker.
+    """
+
+    def __init__(self):
+        self.workers = 0
+        self.tests = 0
+        self.spans = 0
+        self.seconds = 0.0
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        totals = getattr(node, "workeroutput", {}).get("sqlcritic")
+        if totals is None:
+            return
+        self.workers += 1
+        self.tests += totals["tests"]
+        self.spans += totals["spans"]
+        self.seconds += totals["seconds"]
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.workers:
+            _summary(
+                terminalreporter,
+                self.tests,
+                self.spans,
+                self.seconds,
+                workers=self.workers,
+            )
+
+
+def _summary(
+    terminalreporter, tests: int, spans: int, seconds: float, workers: int = 0
+):
+    per_test = seconds / tests if tests else 0.0
+    across = f" across {workers} workers" if workers else ""
+    terminalreporter.write_sep("-", "sql-critic")
+    terminalreporter.write_line(
+        f"traced {tests} tests ({spans} spans){across} in "
+        f"{seconds:.3f}s ({per_test * 1000:.3f}ms per test)"
+    )
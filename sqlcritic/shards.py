@@ -0,0 +1,128 @@
+"""
+Per-worker collector output (i.e. under pytest-xdist) and merging it back together.
+
+    python -m sqlcritic.shards "results.*.ndjson" --output results.json --compact
+"""
+
+import argparse
+import glob
+import heapq
+import json
+import os
+from typing import Iterable, Iterator, List, Optional
+
+from sqlcritic.compact import CompactEncoder, is_compact, iter_compact
+from sqlcritic.utils import is_ndjson, parse_timestamp, write_spans
+
+# set by pytest-xdist in each worker process (i.e. gw0, gw1, ...)
+WORKER_ENV = "PYTEST_XDIST_WORKER"
+# the shard written by a process that isn't an xdist worker
+MAIN_SHARD = "main"
+
+
+def worker_id() -> str:
+    return os.environ.get(WORKER_ENV) or MAIN_SHARD
+
+
+def shard_path(path: str, worker: Optional[str] = None) -> str:
+    """
+    Inserts the worker id before the extension (i.e. `results.gw3.ndjson`).
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{worker or worker_id()}{ext}"
+
+
+def is_pattern(path: str) -> bool:
+    return glob.has_magic(path)
+
+
+def shard_paths(pattern: str) -> List[str]:
+    return sorted(glob.glob(pattern))
+
+
+def iter_spans(path: str) -> Iterator[dict]:
+    """
+    Yields the spans in a single collector output file in the order they were
+    written (only NDJSON files are read incrementally).
+    """
+    with open(path) as f:
+        if is_ndjson(path):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        data = json.load(f)
+
+    if is_compact(data):
+        yield from iter_compact(data)
+    else:
+        yield from data
+
+
+def _end_time(span: dict) -> int:
+    return parse_timestamp(span["end_time"])
+
+
+def merge_shards(paths: Iterable[str]) -> Iterator[dict]:
+    """
+    Yields the spans from every shard ordered by end time (the order a single
+    collector writes them in) holding only one span per shard in memory.
+    """
+    yield from heapq.merge(*[iter_spans(path) for path in paths], key=_end_time)
+
+
+def merge_compact(paths: Iterable[str], normalize: bool = False) -> dict:
+    """
+    Merges the shards into the compact format (see `sqlcritic.compact`).
+    """
+    encoder = CompactEncoder(normalize=normalize)
+    for span in merge_shards(paths):
+        encoder.add_dict(span)
+    return encoder.encode()
+
+
+def write_merged(
+    paths: Iterable[str],
+    output_path: str,
+    compact: bool = False,
+    normalize: bool = False,
+) -> int:
+    """
+    Merges the shards into a single output file and returns the number of spans.
+    The compact format is written if `compact` is set, otherwise NDJSON if
+    `output_path` ends with `.ndjson` (or `.jsonl`) and a JSON array if not.
+    """
+    if compact:
+        data = merge_compact(paths, normalize=normalize)
+        with open(output_path, "w") as f:
+            json.dump(data, f)
+        return len(data["spans"]["span_id"])
+
+    with open(output_path, "w") as f:
+        return write_spans(merge_shards(paths), f, ndjson=is_ndjson(output_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge sharded collector output")
+    parser.add_argument("shards", nargs="+", help="shard files or glob patterns")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--normalize", action="store_true")
+    args = parser.parse_args()
+
+    paths = []
+    for shard in args.shards:
+        paths.extend(shard_paths(shard) if is_pattern(shard) else [shard])
+    # don't merge a previous output into itself
+    paths = [
+        path for path in paths if os.path.abspath(path) != os.path.abspath(args.output)
+    ]
+
+    count = write_merged(
+        paths, args.output, compact=args.compact, normalize=args.normalize
+    )
+    print(f"merged {count} spans from {len(paths)} shards into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
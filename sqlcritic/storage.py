@@ -1,31 +1,290 @@
+import gzip
+import io
 import json
-from typing import Any, Optional
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import IO, Any, Iterator, List, Optional, Sequence, Tuple
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 
+from sqlcritic.profiling import profiler
 
-class Storage:
-    def __init__(self, access_key_id: str, secret_access_key: str, bucket: str):
+# size of the parts uploaded (and held in memory) at once - S3 requires at least 5 MiB
+PART_SIZE = 8 * 1024 * 1024
+
+# lists (i.e. spans) are stored one item per line so they can be decoded as they
+# are downloaded, anything else as a single JSON document
+NDJSON_LAYOUT = "ndjson"
+JSON_LAYOUT = "json"
+
+
+class CompressedJSONStream:
+    """
+    A read-only file of gzip compressed JSON that is encoded as it is read.
+    """
+
+    def __init__(self, data: Any, layout: str, chunk_size: int = 64 * 1024):
+        self._chunks = self._encode(data, layout, chunk_size)
+        self._compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        self._buffer = bytearray()
+        self._done = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._buffer += self._compressor.flush()
+                self._done = True
+            else:
+                self._buffer += self._compressor.compress(chunk)
+
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _encode(self, data: Any, layout: str, chunk_size: int) -> Iterator[bytes]:
+        pieces: Iterator[str]
+        if layout == NDJSON_LAYOUT:
+            pieces = (json.dumps(item) + "\n" for item in data)
+        else:
+            pieces = json.JSONEncoder().iterencode(data)
+
+        chunk = []
+        length = 0
+        for piece in pieces:
+            chunk.append(piece)
+            length += len(piece)
+            if length >= chunk_size:
+                yield "".join(chunk).encode()
+                chunk = []
+                length = 0
+        if chunk:
+            yield "".join(chunk).encode()
+
+
+def _layout(data: Any) -> str:
+    return NDJSON_LAYOUT if isinstance(data, list) else JSON_LAYOUT
+
+
+def _decode(f: IO[bytes], layout: str) -> Any:
+    """
+    Decodes gzip compressed JSON as it is read from the given file.
+    """
+    with gzip.GzipFile(fileobj=f) as decompressed:
+        text = io.TextIOWrapper(decompressed, encoding="utf-8")
+        if layout == NDJSON_LAYOUT:
+            return [json.loads(line) for line in text]
+        return json.load(text)
+
+
+class Storage(ABC):
+    """
+    Stores JSON serializable data by key (e.g. `<sha>/spans`).
+    """
+
+    @abstractmethod
+    def put(self, key: str, data: Any):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the data stored under the given key (or `None` if there isn't any).
+        """
+        raise NotImplementedError()
+
+
+class S3Storage(Storage):
+    def __init__(
+        self,
+        access_key_id: str,
+        secret_access_key: str,
+        bucket: str,
+        part_size: int = PART_SIZE,
+        concurrency: int = 4,
+    ):
         self.session = boto3.Session(
             aws_access_key_id=access_key_id,
             aws_secret_access_key=secret_access_key,
         )
         self.bucket = bucket
         self.s3 = self.session.resource("s3")
+        # peak memory during an upload is roughly `part_size * concurrency`
+        self.transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=concurrency,
+        )
 
     def put(self, key: str, data: Any):
-        obj = self.s3.Object(self.bucket, f"{key}.json")
-        obj.put(Body=json.dumps(data))
+        """
+        Streams the data as compressed JSON (in multiple parts when it's large).
+        """
+        layout = _layout(data)
+        with profiler.stage("s3.put"):
+            self.s3.Bucket(self.bucket).upload_fileobj(
+                CompressedJSONStream(data, layout),
+                f"{key}.json.gz",
+                ExtraArgs={
+                    "ContentType": "application/gzip",
+                    "Metadata": {"layout": layout},
+                },
+                Config=self.transfer_config,
+            )
 
     def get(self, key: str) -> Optional[Any]:
+        with profiler.stage("s3.get"):
+            res = self._get_object(f"{key}.json.gz")
+            if res is None:
+                # stored by an older version (uncompressed)
+                res = self._get_object(f"{key}.json")
+                if res is None:
+                    return None
+                return json.load(res["Body"])
+
+            return _decode(res["Body"], res["Metadata"].get("layout", JSON_LAYOUT))
+
+    def _get_object(self, name: str) -> Optional[dict]:
         try:
-            obj = self.s3.Object(self.bucket, f"{key}.json")
-            res = obj.get()
-            return json.loads(res["Body"].read())
+            return self.s3.Object(self.bucket, name).get()
         except ClientError as err:
             err_code = err.response["Error"]["Code"]
             if err_code == "NoSuchKey" or err_code == "AccessDenied":
                 return None
             else:
                 raise err
+
+
+class LocalStorage(Storage):
+    """
+    Stores compressed JSON files in a local directory.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def put(self, key: str, data: Any):
+        layout = _layout(data)
+        path = self._path(key, layout)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written to a temporary file first so readers never see a partial file
+        stream = CompressedJSONStream(data, layout)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f)  # type: ignore
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        # the key may previously have been stored with the other layout
+        for other in (NDJSON_LAYOUT, JSON_LAYOUT):
+            if other != layout:
+                try:
+                    os.remove(self._path(key, other))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, key: str) -> Optional[Any]:
+        for layout in (NDJSON_LAYOUT, JSON_LAYOUT):
+            try:
+                with open(self._path(key, layout), "rb") as f:
+                    data = _decode(f, layout)
+            except FileNotFoundError:
+                continue
+            # reads count as use for `files()` ordering
+            os.utime(self._path(key, layout))
+            return data
+        return None
+
+    def files(self) -> List[Tuple[float, int, str]]:
+        """
+        Returns the (last used time, size, path) of every stored file.
+        """
+        results = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                results.append((stat.st_mtime, stat.st_size, path))
+        return results
+
+    def _path(self, key: str, layout: str) -> str:
+        return os.path.join(self.directory, f"{key}.{layout}.gz")
+
+
+class CachedStorage(Storage):
+    """
+    Reads through (and writes through) a local cache in front of another storage.
+
+    Least recently used files are evicted once the cache exceeds `max_size` bytes.
+    Keys are expected to only change through this storage (e.g. `<sha>/spans`),
+    otherwise a stale copy may be read from the cache.  Keys that are rewritten
+    elsewhere (i.e. by other runs) should be given in `uncached_prefixes` so they
+    are always read from (and written to) the other storage directly.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        directory: str,
+        max_size: int,
+        uncached_prefixes: Sequence[str] = (),
+    ):
+        self.storage = storage
+        self.cache = LocalStorage(directory)
+        self.max_size = max_size
+        self.uncached_prefixes = tuple(uncached_prefixes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def put(self, key: str, data: Any):
+        self.storage.put(key, data)
+        if not key.startswith(self.uncached_prefixes):
+            self._cache(key, data)
+
+    def get(self, key: str) -> Optional[Any]:
+        if key.startswith(self.uncached_prefixes):
+            return self.storage.get(key)
+
+        data = self.cache.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        data = self.storage.get(key)
+        if data is not None:
+            self._cache(key, data)
+        return data
+
+    def _cache(self, key: str, data: Any):
+        self.cache.put(key, data)
+        with self._lock:
+            self.evict()
+
+    def evict(self):
+        files = sorted(self.cache.files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -1,10 +1,12 @@
+import sys
 from collections.abc import Iterator
 from dataclasses import dataclass
-from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from functools import cached_property, lru_cache
+from typing import Dict, Iterable, List, Optional, Union
 
-from dateutil import parser as dateparser
+from sqlcritic.compact import SQL_ATTRIBUTE, TEST_ATTRIBUTES, is_compact
+from sqlcritic.utils import parse_timestamp
 
 
 class SpanType(Enum):
@@ -24,70 +26,125 @@ class Test:
 
 @dataclass
 class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_time",
+        "end_time",
+        "span_type",
+        "sql",
+        "test",
+    )
+
     name: str
     trace_id: str
     span_id: str
-    parent_id: str
-    attributes: Dict[str, Any]
-    start_time: datetime
-    end_time: datetime
+    parent_id: Optional[str]
+    # nanoseconds since the epoch
+    start_time: int
+    end_time: int
+    span_type: SpanType
+    # the query SQL if this span is of type `DB`
+    sql: Optional[str]
+    # the test info if this span is of type `TEST`
+    test: Optional[Test]
 
     @classmethod
     def parse(cls, data: dict) -> "Span":
+        attributes = data["attributes"]
+        span_type = SpanType.UNKNOWN
+        sql = None
+        test = None
+        if SQL_ATTRIBUTE in attributes:
+            span_type = SpanType.DB
+            sql = attributes[SQL_ATTRIBUTE]
+            assert isinstance(sql, str)
+            sql = sys.intern(sql)
+        elif "test.name" in attributes:
+            span_type = SpanType.TEST
+            test = _test(*[attributes[key] for key in TEST_ATTRIBUTES])
+
+        parent_id = data["parent_id"]
         return Span(
-            name=data["name"],
-            trace_id=data["context"]["trace_id"],
-            span_id=data["context"]["span_id"],
-            parent_id=data["parent_id"],
-            attributes=data["attributes"],
-            start_time=dateparser.parse(data["start_time"]),
-            end_time=dateparser.parse(data["end_time"]),
+            name=sys.intern(data["name"]),
+            trace_id=sys.intern(data["context"]["trace_id"]),
+            # interned so that each parent id shares its parent's span id
+            span_id=sys.intern(data["context"]["span_id"]),
+            parent_id=None if parent_id is None else sys.intern(parent_id),
+            start_time=parse_timestamp(data["start_time"]),
+            end_time=parse_timestamp(data["end_time"]),
+            span_type=span_type,
+            sql=sql,
+            test=test,
         )
 
     def __hash__(self):
         return hash((self.name, self.trace_id, self.span_id, self.parent_id))
 
-    @property
-    def span_type(self) -> SpanType:
-        if "db.statement" in self.attributes:
-            return SpanType.DB
-        elif "test.name" in self.attributes:
-            return SpanType.TEST
-        else:
-            return SpanType.UNKNOWN
-
-    @property
-    def sql(self) -> Optional[str]:
-        """
-        Returns the query SQL if this span is of type `DB`
-        """
-        if self.span_type == SpanType.DB:
-            sql = self.attributes["db.statement"]
-            assert isinstance(sql, str)
-            return sql
-        return None
 
-    @property
-    def test(self) -> Optional[Test]:
-        """
-        Returns the test info if this span is of type `TEST`
-        """
-        if self.span_type == SpanType.TEST:
-            return Test(
-                path=self.attributes["test.path"],
-                line=self.attributes["test.line"],
-                name=self.attributes["test.name"],
-            )
-        return None
+@lru_cache(maxsize=None)
+def _test(path: str, line: int, name: str) -> Test:
+    # tests are shared by every span that references them
+    return Test(path=path, line=line, name=name)
 
 
 class Spans:
-    def __init__(self, spans: List[Span]):
-        self.spans = set(spans)
-        self.index = {span.span_id: span for span in self.spans}
+    def __init__(self, spans: Iterable[Span]):
+        # spans are only held by this index
+        self.index = {span.span_id: span for span in spans}
+
+    def __len__(self) -> int:
+        return len(self.index)
 
-    def __iter__(self):
-        yield from sorted(self.spans, key=lambda span: span.start_time)
+    def __iter__(self) -> Iterator[Span]:
+        return iter(self._ordered)
+
+    @cached_property
+    def _ordered(self) -> List[Span]:
+        return sorted(self.index.values(), key=lambda span: span.start_time)
+
+    @cached_property
+    def _tests(self) -> Dict[str, Optional[Test]]:
+        """
+        Maps every span id to the test it was executed from (if any)
+        """
+        tests: Dict[str, Optional[Test]] = {}
+        # parents start before their children so the walk below usually stops
+        # after a single step on an already visited parent
+        for span in self._ordered:
+            chain = []
+            test = None
+            current = span
+            while current.span_id not in tests:
+                chain.append(current.span_id)
+                parent = (
+                    self.index.get(current.parent_id)
+                    if current.parent_id is not None
+                    else None
+                )
+                if parent is None:
+                    break
+                if parent.span_type == SpanType.TEST:
+                    test = parent.test
+                    break
+                current = parent
+            else:
+                test = tests[current.span_id]
+
+            for span_id in chain:
+                tests[span_id] = test
+        return tests
+
+    def test_for(self, span: Span) -> Optional[Test]:
+        """
+        Returns the nearest test that the given span descends from.
+        """
+        return self._tests.get(span.span_id)
+
+    def descends_from_test(self, span: Span) -> bool:
+        return self.test_for(span) is not None
 
     def parent_span(self, span: Span) -> Optional[Span]:
         """
@@ -95,6 +152,7 @@ class Spans:
         """
         if span.parent_id is not None:
             return self.index[span.parent_id]
+        return None
 
     def ancestors(self, span: Span) -> List[Span]:
         """
@@ -108,5 +166,53 @@ class Spans:
         return ancestors
 
 
-def parse_spans(data: List[dict]) -> Spans:
+def parse_spans(data: Union[Iterable[dict], dict]) -> Spans:
+    if is_compact(data):
+        assert isinstance(data, dict)
+        return parse_compact_spans(data)
     return Spans([Span.parse(item) for item in data])
+
+
+def parse_compact_spans(data: dict) -> Spans:
+    """
+    Loads spans from the compact columnar format (see `sqlcritic.compact`)
+    """
+    strings = [sys.intern(string) for string in data["strings"]]
+    tests = [
+        _test(strings[path], line, strings[name]) for path, line, name in data["tests"]
+    ]
+
+    columns = data["spans"]
+    spans = []
+    for name, trace_id, span_id, parent_id, start, end, sql, test in zip(
+        columns["name"],
+        columns["trace_id"],
+        columns["span_id"],
+        columns["parent_id"],
+        columns["start_time"],
+        columns["end_time"],
+        columns["sql"],
+        columns["test"],
+    ):
+        span_type = SpanType.UNKNOWN
+        if sql is not None:
+            span_type = SpanType.DB
+            sql = strings[sql]
+        elif test is not None:
+            span_type = SpanType.TEST
+            test = tests[test]
+
+        spans.append(
+            Span(
+                name=strings[name],
+                trace_id=strings[trace_id],
+                span_id=sys.intern(span_id),
+                parent_id=None if parent_id is None else sys.intern(parent_id),
+                start_time=start,
+                end_time=end,
+                span_type=span_type,
+                sql=sql,
+                test=test,
+            )
+        )
+    return Spans(spans)
@@ -1,6 +1,11 @@
+import glob
 import hashlib
 import json
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import IO, Iterable, List, Union
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_EPOCH = datetime(1970, 1, 1)
 
 
 def fingerprint(*items: str) -> str:
@@ -9,6 +14,70 @@ def fingerprint(*items: str) -> str:
     return hashlib.sha1(combined.encode()).hexdigest()
 
 
-def load_data(path: str) -> List[dict]:
+def parse_timestamp(value: str) -> int:
+    """
+    Parses an ISO 8601 timestamp into integer nanoseconds since the epoch.
+    """
+    if value.endswith("Z"):
+        # the fixed UTC format written by OpenTelemetry (i.e. 2023-08-21T18:20:34.214080Z)
+        delta = datetime.fromisoformat(value[:-1]) - _NAIVE_EPOCH
+    else:
+        timestamp = datetime.fromisoformat(value)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        delta = timestamp - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 10**9 + delta.microseconds * 1000
+
+
+def format_timestamp(value: int) -> str:
+    """
+    Formats integer nanoseconds since the epoch as OpenTelemetry does (to the
+    nearest microsecond).
+    """
+    timestamp = _NAIVE_EPOCH + timedelta(microseconds=value // 1000)
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def is_ndjson(path: str) -> bool:
+    return path.endswith(".ndjson") or path.endswith(".jsonl")
+
+
+def write_spans(spans: Iterable[dict], f: IO[str], ndjson: bool) -> int:
+    """
+    Writes spans one at a time as NDJSON or as a JSON array and returns the
+    number of spans written.
+    """
+    count = 0
+    if not ndjson:
+        f.write("[")
+    for span in spans:
+        if not ndjson and count > 0:
+            f.write(",")
+        f.write(json.dumps(span))
+        if ndjson:
+            f.write("\n")
+        count += 1
+    if not ndjson:
+        f.write("]")
+    return count
+
+
+def load_data(path: str) -> Union[List[dict], dict]:
+    """
+    Loads collector output (a list of spans or the compact format).  A glob
+    pattern (i.e. `results.*.ndjson`) loads every matching shard merged into the
+    compact format (see `sqlcritic.shards`).
+    """
+    if glob.has_magic(path):
+        from sqlcritic.shards import merge_compact, shard_paths
+
+        paths = shard_paths(path)
+        if not paths:
+            raise FileNotFoundError(f"No files match {path}")
+        return merge_compact(paths)
+
     with open(path) as f:
+        if is_ndjson(path):
+            # one JSON object per line (i.e. streamed collector output)
+            return [json.loads(line) for line in f if line.strip()]
         return json.load(f)
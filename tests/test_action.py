@@ -2,9 +2,10 @@ import json
 from unittest.mock import PropertyMock
 
 from sqlcritic.action import Config, run
-from sqlcritic.analyze import analyze
+from sqlcritic.analyze import analyze, dump_results
 from sqlcritic.github import Pull
 from sqlcritic.notify import GitHubNotifier
+from sqlcritic.profiling import profiler
 from sqlcritic.trace import parse_spans
 from sqlcritic.utils import load_data
 
@@ -50,9 +51,9 @@ def test_run(tmp_path, mocker):
         new_callable=PropertyMock,
     )
 
-    storage_get = mocker.patch("sqlcritic.storage.Storage.get")
+    storage_get = mocker.patch("sqlcritic.storage.S3Storage.get")
     storage_get.side_effect = mock_storage_get
-    storage_put = mocker.patch("sqlcritic.storage.Storage.put")
+    storage_put = mocker.patch("sqlcritic.storage.S3Storage.put")
     comment = mocker.patch("sqlcritic.github.Pull.comment")
     mocker.patch(
         "sqlcritic.database.DatabaseConnection.explain", return_value={"test": "test"}
@@ -66,6 +67,10 @@ def test_run(tmp_path, mocker):
     lines = notifier.format(results)
 
     storage_put.assert_any_call(f"{config.commit_sha}/spans", data)
+    stored = {call.args[0]: call.args[1] for call in storage_put.call_args_list}
+    assert stored[f"{config.commit_sha}/results"] == dump_results(
+        analyze(spans, metadata=stored[f"{config.commit_sha}/metadata"])
+    )
     storage_put.assert_any_call(
         f"{config.commit_sha}/metadata",
         {
@@ -93,3 +98,59 @@ def test_run(tmp_path, mocker):
         },
     )
     comment.assert_called_once_with(lines)
+
+
+def test_run_shared_base(tmp_path, mocker):
+    data = load_data("tests/fixtures/test-spans.json")
+
+    data_path = tmp_path / "results.json"
+    data_path.write_text(json.dumps(data))
+
+    config = Config(
+        data_path=str(data_path),
+        repo_token="test-repo-token",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        aws_s3_bucket="test",
+        event_name="push",
+        repo="foo/bar",
+        commit_sha="test-head-sha",
+        pull_workers=3,
+        profile="stats",
+        profile_dir=str(tmp_path / "profile"),
+    )
+    # restored after the test
+    mocker.patch.object(profiler, "enabled", False)
+    mocker.patch.object(profiler, "stages", {})
+    # stacked PRs with the same base
+    mocker.patch(
+        "sqlcritic.github.Repo.pulls",
+        return_value=[Pull(None, 123), Pull(None, 124), Pull(None, 125)],
+    )
+    mocker.patch(
+        "sqlcritic.github.Pull.base_sha",
+        return_value="test-base-sha",
+        new_callable=PropertyMock,
+    )
+    mocker.patch(
+        "sqlcritic.github.Pull.head_sha",
+        return_value="test-head-sha",
+        new_callable=PropertyMock,
+    )
+
+    storage_get = mocker.patch("sqlcritic.storage.S3Storage.get")
+    storage_get.side_effect = mock_storage_get
+    mocker.patch("sqlcritic.storage.S3Storage.put")
+    comment = mocker.patch("sqlcritic.github.Pull.comment")
+
+    run(config)
+
+    # the base is only loaded once
+    keys = [call.args[0] for call in storage_get.call_args_list]
+    assert keys.count("test-base-sha/spans") == 1
+    assert comment.call_count == 3
+
+    data = json.loads((tmp_path / "profile" / "sqlcritic-profile.json").read_text())
+    stages = {stats["name"]: stats for stats in data["stages"]}
+    assert stages["analyze_base"]["calls"] == 1
+    assert stages["github.comment"]["calls"] == 3
@@ -1,11 +1,25 @@
+import json
+
+import pytest
+
 from sqlcritic.analyze import (
     AnalysisResult,
     AnalysisType,
+    Analyzer,
     MissingIndexAnalyzer,
     NPlusOneAnalyzer,
     SeqScanAnalyzer,
+    analyze,
+    dump_results,
+    load_fingerprints,
+    load_results,
+    partition,
+    run_analyzers,
 )
-from sqlcritic.trace import Test
+from sqlcritic.normalize import normalize_sql
+from sqlcritic.parsing import QueryCache
+from sqlcritic.trace import Spans, SpanType, Test
+from sqlcritic.utils import fingerprint
 
 
 def test_nplusone(spans):
@@ -16,14 +30,103 @@ def test_nplusone(spans):
             analysis_type=AnalysisType.N_PLUS_ONE,
             queries=[
                 'SELECT "demo_entry"."id", "demo_entry"."author_id", "demo_entry"."content", "demo_entry"."published_at" FROM "demo_entry" ORDER BY "demo_entry"."published_at" DESC',
-                'SELECT "demo_author"."id", "demo_author"."name" FROM "demo_author" WHERE "demo_author"."id" = %s LIMIT 21',
+                'SELECT "demo_author"."id", "demo_author"."name" FROM "demo_author" WHERE "demo_author"."id" = %s LIMIT %s',
             ],
             tests={
                 Test(path="tests/test_entries.py", line=9, name="test_entries"),
                 Test(path="tests/test_entries.py", line=30, name="test_entries_other"),
             },
+            extra={"count": 2},
+        )
+    ]
+
+
+@pytest.fixture
+def query_spans(make_span):
+    """
+    Returns a factory for the spans of a test that executes the given queries
+    (in order).
+    """
+
+    def query_spans(queries):
+        test = make_span(
+            "test", None, 0, end_time=1000, test=Test("test.py", 1, "test")
+        )
+        return Spans(
+            [test]
+            + [
+                make_span(f"{i}", "test", i + 1, sql=sql, name="SELECT")
+                for i, sql in enumerate(queries)
+            ]
         )
+
+    return query_spans
+
+
+def nplusone(spans, **kwargs):
+    return [
+        (result.queries, result.extra)
+        for result in NPlusOneAnalyzer(spans, **kwargs).analyze()
+    ]
+
+
+def test_nplusone_interleaved(query_spans):
+    # a list query followed by a loop that lazily loads two relations
+    queries = ["SELECT * FROM entry"]
+    for i in range(3):
+        queries += [
+            f"SELECT * FROM author WHERE id = {i}",
+            f"SELECT * FROM tag WHERE entry_id = {i}",
+        ]
+    spans = query_spans(queries)
+
+    assert nplusone(spans) == [
+        (
+            ["SELECT * FROM entry", "SELECT * FROM author WHERE id = %s"],
+            {"count": 3},
+        ),
+        (
+            ["SELECT * FROM entry", "SELECT * FROM tag WHERE entry_id = %s"],
+            {"count": 3},
+        ),
     ]
+    results = NPlusOneAnalyzer(spans).analyze()
+    assert all(result.tests == {Test("test.py", 1, "test")} for result in results)
+
+    assert nplusone(spans, threshold=4) == []
+
+
+def test_nplusone_repeated_before_source(query_spans):
+    # the N query also ran once before the list query
+    queries = ["SELECT * FROM author WHERE id = 1", "SELECT * FROM entry"]
+    queries += [f"SELECT * FROM author WHERE id = {i}" for i in range(5)]
+
+    assert nplusone(query_spans(queries)) == [
+        (
+            ["SELECT * FROM entry", "SELECT * FROM author WHERE id = %s"],
+            {"count": 5},
+        )
+    ]
+
+
+def test_nplusone_unrelated_repeats(query_spans):
+    # a statement that's repeated with other queries in between isn't an N+1
+    queries = [
+        "SELECT * FROM entry",
+        "SELECT * FROM author WHERE id = 1",
+        "SELECT * FROM tag",
+        "SELECT * FROM author WHERE id = 2",
+    ]
+    assert nplusone(query_spans(queries)) == []
+
+
+def test_analyze_nplusone_threshold(query_spans):
+    queries = ["SELECT * FROM entry"]
+    queries += [f"SELECT * FROM author WHERE id = {i}" for i in range(3)]
+    spans = query_spans(queries)
+
+    assert len(list(analyze(spans))) == 1
+    assert list(analyze(spans, n_plus_one_threshold=4)) == []
 
 
 def test_seq_scan(spans, metadata):
@@ -72,3 +175,144 @@ def test_index(spans, metadata):
             extra={"demo_author": ["id"]},
         )
     ]
+
+
+class RecordingAnalyzer(Analyzer):
+    span_types = frozenset([SpanType.DB])
+    span_names = frozenset(["SELECT"])
+
+    def __init__(self, spans, metadata=None):
+        super().__init__(spans, metadata=metadata)
+        self.visited = []
+
+    def visit(self, span):
+        self.visited.append(span)
+
+
+def test_run_analyzers_filters_spans(spans):
+    analyzer = RecordingAnalyzer(spans)
+    run_analyzers([analyzer], spans)
+
+    assert len(analyzer.visited) > 0
+    assert analyzer.visited == [
+        span
+        for span in spans
+        if span.span_type == SpanType.DB and span.name == "SELECT"
+    ]
+
+
+def test_analyze_single_pass(spans, metadata, mocker):
+    expected = (
+        NPlusOneAnalyzer(spans, metadata=metadata).analyze()
+        + MissingIndexAnalyzer(spans, metadata=metadata).analyze()
+        + SeqScanAnalyzer(spans, metadata=metadata).analyze()
+    )
+
+    iterations = mocker.spy(Spans, "__iter__")
+    results = list(analyze(spans, metadata=metadata))
+
+    assert iterations.call_count == 1
+    assert results == expected
+
+
+@pytest.fixture
+def concurrent_spans(make_span):
+    """
+    Spans of tests that ran concurrently (in separate traces), as in merged
+    pytest-xdist shards.
+    """
+    spans = []
+    for t in range(6):
+        test = Test("test.py", t, f"test_{t}")
+        spans.append(make_span(f"test{t}", None, t, 10_000, test=test, trace_id=f"{t}"))
+        queries = [f"SELECT * FROM entry_{t % 3}"]
+        queries += [f"SELECT * FROM author WHERE id = {t * 10 + i}" for i in range(3)]
+        for i, sql in enumerate(queries):
+            spans.append(
+                make_span(
+                    f"query{t}.{i}",
+                    f"test{t}",
+                    100 + i * 10 + t,
+                    sql=sql,
+                    name="SELECT",
+                    trace_id=f"{t}",
+                )
+            )
+    return Spans(spans)
+
+
+def test_partition(concurrent_spans):
+    shards = partition(concurrent_spans, 4)
+
+    assert [len(shard) for shard in shards] == [10, 10, 5, 5]
+    assert sorted(span.span_id for shard in shards for span in shard) == sorted(
+        span.span_id for span in concurrent_spans
+    )
+    for shard in shards:
+        assert shard == [span for span in concurrent_spans if span in shard]
+        # tests aren't split between shards
+        ids = set(span.span_id for span in shard)
+        assert all(span.parent_id in ids for span in shard if span.parent_id)
+
+
+def test_analyze_parallel_concurrent_tests(concurrent_spans):
+    seq_scan = {"Plan": {"Node Type": "Seq Scan"}}
+    metadata = {
+        "explained": {
+            span.sql: seq_scan for span in concurrent_spans if span.sql is not None
+        },
+        "indexes": [],
+    }
+    expected = list(analyze(concurrent_spans, metadata=metadata))
+
+    assert len(expected) > 6
+    assert list(analyze(concurrent_spans, metadata=metadata, workers=2)) == expected
+
+
+def test_analyze_parallel(spans, metadata):
+    metadata["indexes"] = []
+    expected = list(analyze(spans, metadata=metadata))
+
+    assert len(expected) > 1
+    assert list(analyze(spans, metadata=metadata, workers=2)) == expected
+
+
+def test_analyze_parallel_persists_queries(spans, metadata, tmp_path, mocker):
+    metadata["indexes"] = []
+    cache = QueryCache()
+    cache.open(str(tmp_path))
+    mocker.patch("sqlcritic.analyze.query_cache", cache)
+
+    list(analyze(spans, metadata=metadata, workers=2))
+    cache.save()
+
+    # queries parsed in the worker processes are written back
+    reopened = QueryCache()
+    reopened.open(str(tmp_path))
+    parsed = set(
+        fingerprint(normalize_sql(span.sql))
+        for span in spans
+        if span.span_type == SpanType.DB
+        and span.name == "SELECT"
+        and spans.test_for(span) is not None
+    )
+    assert parsed
+    assert set(reopened.stored()) == parsed
+
+
+def test_dump_results(spans, metadata):
+    metadata["indexes"] = []
+    results = list(analyze(spans, metadata=metadata))
+    # round trip through storage
+    data = json.loads(json.dumps(dump_results(results)))
+
+    assert load_results(data) == results
+    assert load_fingerprints(data) == set(result.fingerprint for result in results)
+
+    # analyzed with a different N+1 threshold
+    assert load_results(data, n_plus_one_threshold=5) is None
+    assert load_fingerprints(data, n_plus_one_threshold=5) is None
+
+    data["version"] += 1
+    assert load_results(data) is None
+    assert load_fingerprints(data) is None
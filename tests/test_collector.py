@@ -1,4 +1,10 @@
+import json
+
+import pytest
+
 from sqlcritic.collector import Collector
+from sqlcritic.trace import SpanType, Test, parse_spans
+from sqlcritic.utils import load_data
 
 
 def test_collector():
@@ -31,3 +37,192 @@ def test_collector():
     assert result["attributes"]["test.path"] == "example.py"
     assert result["attributes"]["test.line"] == 123
     assert result["attributes"]["test.name"] == "test_example"
+
+
+def test_collector_streaming(tmp_path):
+    stream_path = tmp_path / "results.ndjson"
+    collector = Collector(stream_path=str(stream_path), buffer_size=2)
+
+    with collector.trace_test("example.py", 123, "test_example"):
+        for i in range(5):
+            with collector.tracer.start_as_current_span(f"fake_db_span_{i}") as span:
+                span.set_attribute("db.name", "example")
+                span.set_attribute("db.statement", f"select * from foo_{i};")
+
+    # buffer is bounded so most spans should already be on disk
+    assert len(stream_path.read_text().splitlines()) >= 4
+
+    output_path = tmp_path / "output.ndjson"
+    collector.save_results(str(output_path))
+
+    data = load_data(str(output_path))
+    assert len(data) == 6
+    assert [item["name"] for item in data] == [
+        "fake_db_span_0",
+        "fake_db_span_1",
+        "fake_db_span_2",
+        "fake_db_span_3",
+        "fake_db_span_4",
+        "test",
+    ]
+
+    spans = parse_spans(data)
+    db_spans = [span for span in spans if span.span_type == SpanType.DB]
+    assert [span.sql for span in db_spans] == [
+        f"select * from foo_{i};" for i in range(5)
+    ]
+
+
+def test_collector_streaming_json_output(tmp_path):
+    stream_path = tmp_path / "results.ndjson"
+    collector = Collector(stream_path=str(stream_path), buffer_size=2)
+
+    with collector.trace_test("example.py", 123, "test_example"):
+        for i in range(3):
+            with collector.tracer.start_as_current_span(f"fake_db_span_{i}") as span:
+                span.set_attribute("db.name", "example")
+                span.set_attribute("db.statement", f"select * from foo_{i};")
+
+    output_path = tmp_path / "results.json"
+    collector.save_results(str(output_path))
+
+    # the stream is converted to a JSON array
+    data = json.loads(output_path.read_text())
+    assert [item["name"] for item in data] == [
+        "fake_db_span_0",
+        "fake_db_span_1",
+        "fake_db_span_2",
+        "test",
+    ]
+    assert load_data(str(output_path)) == data
+    assert not stream_path.exists()
+
+
+def test_collector_compact(tmp_path):
+    collector = Collector()
+
+    with collector.trace_test("example.py", 123, "test_example"):
+        with collector.tracer.start_as_current_span("fake_db_span") as span:
+            span.set_attribute("db.name", "example")
+            span.set_attribute("db.statement", "select * from foo;")
+
+    output_path = tmp_path / "results.json"
+    collector.save_results(str(output_path), compact=True)
+
+    expected = parse_spans(collector.results())
+    spans = parse_spans(load_data(str(output_path)))
+
+    assert [(span.span_id, span.parent_id) for span in spans] == [
+        (span.span_id, span.parent_id) for span in expected
+    ]
+    for span, expected_span in zip(spans, expected):
+        # the JSON output rounds timestamps to the nearest microsecond
+        assert abs(span.start_time - expected_span.start_time) <= 1000
+    db_span, test_span = list(spans)[1], list(spans)[0]
+    assert db_span.sql == "select * from foo;"
+    assert test_span.test == Test(path="example.py", line=123, name="test_example")
+
+
+def test_collector_normalize(tmp_path):
+    collector = Collector(normalize_sql=True)
+
+    for name in ["test_a", "test_b"]:
+        with collector.trace_test("example.py", 123, name):
+            for i in range(3 if name == "test_a" else 1):
+                with collector.tracer.start_as_current_span("fake_db_span") as span:
+                    span.set_attribute("db.name", "example")
+                    span.set_attribute(
+                        "db.statement", f"select * from foo where id = {i};"
+                    )
+
+    assert {item["attributes"].get("db.statement") for item in collector.results()} == {
+        "select * from foo where id = %s;",
+        None,
+    }
+
+    output_path = tmp_path / "results.json"
+    collector.save_results(str(output_path), compact=True)
+    data = load_data(str(output_path))
+
+    strings = data["strings"]
+    occurrences = [
+        (strings[data["tests"][test][2]], strings[sql], count)
+        for test, sql, count in data["occurrences"]
+    ]
+    assert sorted(occurrences) == [
+        ("test_a", "select * from foo where id = %s;", 3),
+        ("test_b", "select * from foo where id = %s;", 1),
+    ]
+
+
+def test_collector_streaming_normalize(tmp_path):
+    stream_path = tmp_path / "results.ndjson"
+    collector = Collector(stream_path=str(stream_path), normalize_sql=True)
+
+    with collector.trace_test("example.py", 123, "test_example"):
+        with collector.tracer.start_as_current_span("fake_db_span") as span:
+            span.set_attribute("db.statement", "select * from foo where id = 1;")
+
+    output_path = tmp_path / "output.ndjson"
+    collector.save_results(str(output_path))
+
+    spans = parse_spans(load_data(str(output_path)))
+    assert [span.sql for span in spans if span.sql is not None] == [
+        "select * from foo where id = %s;"
+    ]
+
+
+def test_collector_batch(tmp_path):
+    collector = Collector(batch=True)
+
+    with collector.trace_test("example.py", 123, "test_example"):
+        for i in range(50):
+            with collector.tracer.start_as_current_span("fake_db_span") as span:
+                span.set_attribute("db.statement", f"select * from foo_{i};")
+
+    # exported from a background thread but flushed before returning results
+    assert len(collector.results()) == 51
+
+    output_path = tmp_path / "results.json"
+    collector.save_results(str(output_path), compact=True)
+    assert len(parse_spans(load_data(str(output_path)))) == 51
+
+
+def test_collector_filtering():
+    collector = Collector(db_and_tests_only=True, tests_only=True, max_repeats=2)
+
+    with collector.tracer.start_as_current_span("setup_db_span") as span:
+        span.set_attribute("db.statement", "create table foo;")
+
+    with collector.trace_test("example.py", 123, "test_example"):
+        with collector.tracer.start_as_current_span("request"):
+            for i in range(5):
+                with collector.tracer.start_as_current_span("SELECT") as span:
+                    span.set_attribute("db.statement", "select * from foo;")
+            with collector.tracer.start_as_current_span("SELECT") as span:
+                span.set_attribute("db.statement", "select * from bar;")
+
+    spans = parse_spans(collector.results())
+    assert [span.name for span in spans] == ["test", "SELECT", "SELECT", "SELECT"]
+
+    # DB spans are reparented to the test once the intermediate span is dropped
+    test_span, *db_spans = spans
+    assert all(span.parent_id == test_span.span_id for span in db_spans)
+    assert [span.sql for span in db_spans] == [
+        "select * from foo;",
+        "select * from foo;",
+        "select * from bar;",
+    ]
+    assert collector.processor.dropped == 5
+    # the repeated `foo` queries
+    assert collector.processor.dropped_repeats == 3
+
+
+def test_collector_max_repeats_below_threshold():
+    # N+1 queries would never be found
+    with pytest.raises(ValueError):
+        Collector(max_repeats=1)
+    # against the threshold the action is configured with
+    with pytest.raises(ValueError):
+        Collector(max_repeats=2, n_plus_one_threshold=3)
+    Collector(max_repeats=3, n_plus_one_threshold=3)
@@ -0,0 +1,71 @@
+import json
+
+from sqlcritic.analyze import analyze
+from sqlcritic.compact import compact, is_compact
+from sqlcritic.trace import parse_spans
+from sqlcritic.utils import load_data
+
+
+def span_fields(spans):
+    return [
+        (
+            span.name,
+            span.trace_id,
+            span.span_id,
+            span.parent_id,
+            span.start_time,
+            span.end_time,
+            span.span_type,
+            span.sql,
+            span.test,
+        )
+        for span in spans
+    ]
+
+
+def test_compact_round_trip(tmp_path):
+    data = load_data("tests/fixtures/test-spans.json")
+
+    compact_path = tmp_path / "results.json"
+    compact_path.write_text(json.dumps(compact(data)))
+    compact_data = load_data(str(compact_path))
+
+    assert is_compact(compact_data)
+    assert span_fields(parse_spans(compact_data)) == span_fields(parse_spans(data))
+
+
+def test_compact_interning():
+    data = load_data("tests/fixtures/test-spans.json")
+    compact_data = compact(data)
+
+    sql = [item["attributes"].get("db.statement") for item in data]
+    distinct_sql = set(item for item in sql if item is not None)
+    assert len(distinct_sql) < len([item for item in sql if item is not None])
+
+    # each distinct statement is only stored once
+    strings = compact_data["strings"]
+    assert len(strings) == len(set(strings))
+    assert distinct_sql <= set(strings)
+    assert len(compact_data["tests"]) == 2
+
+
+def test_compact_analysis(metadata):
+    data = load_data("tests/fixtures/test-spans.json")
+
+    results = list(analyze(parse_spans(compact(data)), metadata=metadata))
+    assert results == list(analyze(parse_spans(data), metadata=metadata))
+
+
+def test_compact_normalize():
+    data = load_data("tests/fixtures/test-spans.json")
+    compact_data = compact(data, normalize=True)
+    spans = parse_spans(compact_data)
+
+    # every statement is counted once against the test that executed it
+    occurrences = compact_data["occurrences"]
+    assert sum(count for _, _, count in occurrences) == len(
+        [span for span in spans if span.sql is not None and spans.test_for(span)]
+    )
+    strings = compact_data["strings"]
+    for _, sql, _ in occurrences:
+        assert "$1" not in strings[sql]
@@ -1,6 +1,15 @@
-from sqlcritic.analyze import AnalysisResult, AnalysisType
-from sqlcritic.comparison import Comparison
-from sqlcritic.trace import Test
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlcritic.analyze import (
+    ANALYZER_VERSION,
+    AnalysisResult,
+    AnalysisType,
+    analyze,
+    dump_results,
+)
+from sqlcritic.comparison import BaseCache, Comparison
+from sqlcritic.trace import Test, parse_spans
 from sqlcritic.utils import load_data
 
 
@@ -11,6 +20,9 @@ class MockStorage:
     def get(self, key: str) -> any:
         return self.data.get(key)
 
+    def put(self, key: str, data: any):
+        self.data[key] = data
+
 
 def test_new_analysis_results():
     storage = MockStorage(
@@ -32,7 +44,7 @@ def test_new_analysis_results():
             analysis_type=AnalysisType.N_PLUS_ONE,
             queries=[
                 'SELECT "demo_entry"."id", "demo_entry"."author_id", "demo_entry"."content", "demo_entry"."published_at" FROM "demo_entry" ORDER BY "demo_entry"."published_at" DESC',
-                'SELECT "demo_author"."id", "demo_author"."name" FROM "demo_author" WHERE "demo_author"."id" = %s LIMIT 21',
+                'SELECT "demo_author"."id", "demo_author"."name" FROM "demo_author" WHERE "demo_author"."id" = %s LIMIT %s',
             ],
             tests=set(
                 [
@@ -42,6 +54,7 @@ def test_new_analysis_results():
                     ),
                 ]
             ),
+            extra={"count": 2},
         )
     ]
 
@@ -63,3 +76,85 @@ def test_new_analysis_results_same_spans():
     results = comparison.new_analysis_results()
     # empty since there are no new results in the head
     assert list(results) == []
+
+
+def test_new_analysis_results_stored_base():
+    base_results = analyze(
+        parse_spans(load_data("tests/fixtures/test-spans-base.json"))
+    )
+    storage = MockStorage(
+        {
+            # the base spans aren't needed
+            "test-base-sha/results": dump_results(base_results),
+            "test-head-sha/spans": load_data("tests/fixtures/test-spans.json"),
+        }
+    )
+
+    comparison = Comparison(
+        storage=storage,
+        base_sha="test-base-sha",
+        head_sha="test-head-sha",
+    )
+
+    results = list(comparison.new_analysis_results())
+    assert [result.analysis_type for result in results] == [AnalysisType.N_PLUS_ONE]
+
+
+def test_new_analysis_results_stored_version_mismatch():
+    storage = MockStorage(
+        {
+            "test-base-sha/spans": load_data("tests/fixtures/test-spans.json"),
+            "test-base-sha/results": {"version": ANALYZER_VERSION - 1, "results": []},
+            "test-head-sha/spans": load_data("tests/fixtures/test-spans.json"),
+        }
+    )
+
+    comparison = Comparison(
+        storage=storage,
+        base_sha="test-base-sha",
+        head_sha="test-head-sha",
+    )
+
+    # the base is re-analyzed (so nothing is new) and stored with the current version
+    assert list(comparison.new_analysis_results()) == []
+    stored = storage.data["test-base-sha/results"]
+    assert stored["version"] == ANALYZER_VERSION
+    assert len(stored["results"]) == 1
+
+
+def test_base_cache():
+    cache = BaseCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        time.sleep(0.05)
+        return {"fingerprint"}
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: cache.get("sha", load), range(4)))
+
+    assert results == [{"fingerprint"}] * 4
+    assert len(loads) == 1
+
+
+def test_prepare(mocker):
+    storage = MockStorage(
+        {
+            "test-base-sha/spans": load_data("tests/fixtures/test-spans-base.json"),
+            "test-head-sha/spans": load_data("tests/fixtures/test-spans.json"),
+        }
+    )
+    comparison = Comparison(
+        storage=storage,
+        base_sha="test-base-sha",
+        head_sha="test-head-sha",
+    )
+    comparison.prepare()
+
+    # nothing is loaded (or analyzed) once the comparison is prepared
+    analyze = mocker.patch("sqlcritic.comparison.analyze")
+    get = mocker.spy(storage, "get")
+    assert len(list(comparison.new_analysis_results())) == 1
+    assert not analyze.called
+    assert not get.called
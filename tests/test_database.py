@@ -1,5 +1,13 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.extras import LoggingConnection
+
 from sqlcritic.database import DatabaseConnection
-from sqlcritic.database.types import Index
+from sqlcritic.database.cache import ExplainCache
+from sqlcritic.database.postgres import ExplainSession, PostgresAdapter
+from sqlcritic.database.types import Index, IndexLookup
 
 
 def test_postgres_explain(spans, db_url):
@@ -12,6 +20,157 @@ def test_postgres_explain(spans, db_url):
         assert "Plan" in plan  # output from Postgres explain
 
 
+def test_postgres_explain_concurrent(spans, db_url):
+    expected = DatabaseConnection(db_url).explain(spans)
+    results = DatabaseConnection(db_url, workers=4).explain(spans)
+
+    assert list(results.items()) == list(expected.items())
+
+
+def test_postgres_explain_errors(db_url):
+    adapter = PostgresAdapter(db_url, workers=2)
+    adapter.connect()
+
+    queries = [
+        'SELECT * FROM "demo_author" WHERE "id" = %s',
+        'SELECT * FROM "missing_table"',
+        'SELECT * FROM "demo_entry" WHERE "author_id" = %s',
+    ]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(adapter.explain, queries))
+    adapter.close()
+
+    # a failing query doesn't affect the others
+    assert [result is not None for result in results] == [True, False, True]
+    assert results[0]["Plan"]["Relation Name"] == "demo_author"
+
+
+class StatementLog:
+    def __init__(self):
+        self.statements = []
+
+    def write(self, statement):
+        self.statements.append(statement)
+
+
+def test_postgres_explain_session(db_url):
+    connection = psycopg2.connect(db_url, connection_factory=LoggingConnection)
+    log = StatementLog()
+    connection.initialize(log)
+
+    queries = [
+        'SELECT * FROM "demo_author" WHERE "id" = %s',
+        'SELECT * FROM "demo_entry" WHERE "author_id" = %s',
+        'SELECT * FROM "missing_table"',
+        'SELECT * FROM "demo_entry" WHERE "id" = $1 AND "author_id" = $2;',
+    ]
+    session = ExplainSession(connection)
+    results = [session.explain(query) for query in queries]
+    session.close()
+    connection.close()
+
+    assert [result is not None for result in results] == [True, True, False, True]
+    assert results[0]["Plan"]["Relation Name"] == "demo_author"
+    # one round trip per query, plus one to recover from the failed query
+    # and one to clean up
+    assert len(log.statements) == len(queries) + 2
+
+
+def test_postgres_explain_trailing_comment(db_url):
+    adapter = PostgresAdapter(db_url)
+    adapter.connect()
+
+    queries = [
+        'SELECT * FROM "demo_author" WHERE "id" = %s -- controller=authors',
+        'SELECT * FROM "demo_entry" WHERE "author_id" = %s; -- action=index',
+    ]
+    results = adapter.explain_many(queries)
+    adapter.close()
+
+    # the comment doesn't swallow the `EXPLAIN`
+    assert [result["Plan"]["Relation Name"] for result in results] == [
+        "demo_author",
+        "demo_entry",
+    ]
+
+
+class MemoryStorage:
+    def __init__(self):
+        self.data = {}
+
+    def put(self, key, data):
+        self.data[key] = json.dumps(data)
+
+    def get(self, key):
+        if key in self.data:
+            return json.loads(self.data[key])
+        return None
+
+
+def test_explain_cache():
+    storage = MemoryStorage()
+
+    cache = ExplainCache(storage, "schema", max_entries=2)
+    assert cache.get("SELECT 1") is None
+    cache.put("SELECT 1", {"Plan": 1})
+    cache.put("SELECT 2", {"Plan": 2})
+    cache.save()
+
+    cache = ExplainCache(storage, "schema", max_entries=2)
+    assert cache.get("SELECT 2") == {"Plan": 2}
+    cache.put("SELECT 3", {"Plan": 3})
+    cache.save()
+
+    # the least recently used plan was evicted
+    assert cache.stats() == {"hits": 1, "misses": 0, "evictions": 1, "entries": 2}
+    cache = ExplainCache(storage, "schema", max_entries=2)
+    assert cache.get("SELECT 1") is None
+    assert cache.get("SELECT 2") == {"Plan": 2}
+    assert cache.get("SELECT 3") == {"Plan": 3}
+
+    # plans are not shared across schemas
+    assert ExplainCache(storage, "other").get("SELECT 2") is None
+
+
+def test_postgres_explain_cached(spans, db_url, mocker):
+    storage = MemoryStorage()
+    database = DatabaseConnection(db_url)
+
+    cache = ExplainCache(storage, database.schema_fingerprint())
+    expected = database.explain(spans, cache=cache)
+    cache.save()
+    assert cache.hits == 0
+    assert cache.misses == len(expected)
+
+    explain_many = mocker.spy(database.adapter, "explain_many")
+    cache = ExplainCache(storage, database.schema_fingerprint())
+    results = database.explain(spans, cache=cache)
+
+    assert list(results.items()) == list(expected.items())
+    assert cache.hits == len(expected)
+    assert cache.misses == 0
+    explain_many.assert_not_called()
+
+
+def test_postgres_schema_fingerprint(db_url):
+    database = DatabaseConnection(db_url)
+    before = database.schema_fingerprint()
+    assert database.schema_fingerprint() == before
+
+    connection = psycopg2.connect(db_url)
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE INDEX "demo_author_name" ON "demo_author" ("name")')
+        connection.commit()
+        try:
+            assert database.schema_fingerprint() != before
+        finally:
+            cursor.execute('DROP INDEX "demo_author_name"')
+            connection.commit()
+    connection.close()
+
+    assert database.schema_fingerprint() == before
+
+
 def test_postgres_indexes(db_url):
     database = DatabaseConnection(db_url)
     results = database.indexes()
@@ -38,3 +197,48 @@ def test_postgres_indexes(db_url):
             ),
         ]
     )
+
+
+def test_index_lookup():
+    lookup = IndexLookup(
+        [
+            Index(
+                schema_name="public",
+                table_name="demo_entry",
+                index_name="demo_entry_author_published_index",
+                columns=("author_id", "published_at"),
+            ),
+            Index(
+                schema_name="other",
+                table_name="demo_author",
+                index_name="demo_author_pkey",
+                columns=("id",),
+            ),
+        ]
+    )
+
+    assert lookup.indexes_columns("demo_entry", [])
+    assert lookup.indexes_columns("demo_entry", ["author_id"])
+    assert lookup.indexes_columns("demo_entry", ["author_id", "published_at"])
+    assert not lookup.indexes_columns("demo_entry", ["published_at"])
+    assert not lookup.indexes_columns("demo_entry", ["author_id", "id"])
+    assert not lookup.indexes_columns("missing", ["id"])
+
+    assert lookup.indexes_columns("demo_author", ["id"])
+    assert lookup.indexes_columns("demo_author", ["id"], schema_name="other")
+    assert not lookup.indexes_columns("demo_author", ["id"], schema_name="public")
+
+
+def test_index_lookup_from_metadata():
+    # columns are lists once metadata has been through storage
+    lookup = IndexLookup.from_metadata(
+        [
+            {
+                "columns": ["id"],
+                "index_name": "demo_author_pkey",
+                "schema_name": "public",
+                "table_name": "demo_author",
+            }
+        ]
+    )
+    assert lookup.indexes_columns("demo_author", ["id"])
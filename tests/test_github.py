@@ -1,4 +1,9 @@
+from unittest.mock import MagicMock
+
+from github import GithubException
+
 from sqlcritic.github import Pull, Repo
+from sqlcritic.storage import LocalStorage
 
 # need to temporarily paste a real token here if you want to update the cassettes
 token = "test"
@@ -31,3 +36,53 @@ def test_commit_pulls(vcr_cassette):
     pulls = repo.pulls("9c4868ed45c1e680ed7b2456456340d21a63f6e3")
     assert len(pulls) == 1
     assert pulls[0].number == 5
+    # read from the listing (without fetching the PR)
+    assert pulls[0].base_sha == "7cb05bafbe3713256e32e03015c9fe7e92ce759f"
+    assert pulls[0].head_sha == "9c4868ed45c1e680ed7b2456456340d21a63f6e3"
+
+
+def test_pull_comment_remembered(tmp_path):
+    comments = {}
+
+    def create_comment(body):
+        comments[1] = MagicMock(id=1, body=body)
+        return comments[1]
+
+    def get_comment(comment_id):
+        if comment_id not in comments:
+            raise GithubException(404)
+        return comments[comment_id]
+
+    issue = MagicMock()
+    issue.get_comments.return_value = []
+    issue.create_comment.side_effect = create_comment
+    issue.get_comment.side_effect = get_comment
+
+    storage = LocalStorage(str(tmp_path))
+    pull = Pull(MagicMock(full_name="foo/bar"), 2, storage=storage)
+    pull.issue = issue
+
+    pull.comment(["foo"])
+    issue.create_comment.assert_called_once()
+    assert storage.get("comments/foo/bar/2") == {"id": 1}
+
+    # unchanged so there's nothing to do
+    pull.comment(["foo"])
+    issue.get_comment.assert_called_once_with(1)
+    comments[1].edit.assert_not_called()
+
+    # the remembered comment is edited without searching the comments
+    pull.comment(["bar"])
+    assert issue.get_comments.call_count == 1
+    assert "bar" in comments[1].edit.call_args.args[0]
+
+    # a comment edited by hand is restored
+    comments[1].body = "edited"
+    pull.comment(["bar"])
+    assert comments[1].edit.call_count == 2
+
+    # a deleted comment is posted again
+    del comments[1]
+    pull.comment(["bar"])
+    assert issue.create_comment.call_count == 2
+    assert "bar" in comments[1].body
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from sqlcritic.github_async import AsyncRepo
+from sqlcritic.notify import GitHubNotifier
+from sqlcritic.storage import LocalStorage
+
+
+class GitHubStub:
+    """
+    Serves just enough of the GitHub API for a single repo and PR.
+    """
+
+    def __init__(self):
+        self.requests = []
+        # comments that weren't made by the bot
+        self.comments = [{"id": i, "body": f"comment {i}"} for i in range(1, 4)]
+        # responses to send before handling requests normally
+        self.rate_limited = 0
+
+    def handle(self, handler: BaseHTTPRequestHandler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = json.loads(handler.rfile.read(length)) if length else None
+        path = handler.path
+        self.requests.append((handler.command, path.split("?")[0]))
+
+        if self.rate_limited > 0:
+            self.rate_limited -= 1
+            return self._respond(
+                handler,
+                403,
+                {},
+                {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0"},
+            )
+
+        if path.startswith("/repos/foo/bar/commits/abc/pulls"):
+            pull = {"number": 2, "base": {"sha": "base"}, "head": {"sha": "abc"}}
+            return self._respond(handler, 200, [pull])
+
+        if path.startswith("/repos/foo/bar/issues/2/comments"):
+            if handler.command == "POST":
+                comment = {"id": len(self.comments) + 1, "body": body["body"]}
+                self.comments.append(comment)
+                return self._respond(handler, 201, comment)
+
+            # two comments per page
+            query = parse_qs(urlparse(path).query)
+            page = int(query.get("page", ["1"])[0])
+            headers = {}
+            if page * 2 < len(self.comments):
+                url = f"http://{handler.headers['Host']}/repos/foo/bar/issues/2/comments?page={page + 1}"
+                headers["Link"] = f'<{url}>; rel="next"'
+            items = self.comments[(page - 1) * 2 : page * 2]
+            return self._respond(handler, 200, items, headers)
+
+        if path.startswith("/repos/foo/bar/issues/comments/"):
+            comment_id = int(path.split("/")[-1])
+            for comment in self.comments:
+                if comment["id"] == comment_id:
+                    if handler.command == "PATCH":
+                        comment["body"] = body["body"]
+                    return self._respond(handler, 200, comment)
+
+        return self._respond(handler, 404, {"message": "Not Found"})
+
+    def _respond(self, handler, status, data, headers={}):
+        content = json.dumps(data).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(content)
+
+
+@pytest.fixture
+def github():
+    stub = GitHubStub()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            stub.handle(self)
+
+        do_POST = do_PATCH = do_GET
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stub.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
+def test_pulls(github):
+    async def pulls():
+        async with AsyncRepo("foo/bar", "token", base_url=github.url) as repo:
+            return await repo.pulls("abc")
+
+    pulls = asyncio.run(pulls())
+    assert [(pull.number, pull.base_sha, pull.head_sha) for pull in pulls] == [
+        (2, "base", "abc")
+    ]
+
+
+def test_pull_comment(github):
+    async def comment():
+        async with AsyncRepo("foo/bar", "token", base_url=github.url) as repo:
+            (pull,) = await repo.pulls("abc")
+            await pull.comment(["foo"])
+            await pull.comment(["bar"])
+            return await pull.bot_comment()
+
+    comment = asyncio.run(comment())
+
+    # it updates the same comment (found on the second page)
+    assert "bar" in comment["body"]
+    assert len(github.comments) == 4
+    assert ("PATCH", "/repos/foo/bar/issues/comments/4") in github.requests
+
+
+def test_pull_comment_remembered(github, tmp_path):
+    storage = LocalStorage(str(tmp_path))
+
+    async def comment(lines):
+        async with AsyncRepo(
+            "foo/bar", "token", storage=storage, base_url=github.url
+        ) as repo:
+            (pull,) = await repo.pulls("abc")
+            await pull.comment(lines)
+
+    asyncio.run(comment(["foo"]))
+    assert storage.get("comments/foo/bar/2") == {"id": 4}
+    github.requests.clear()
+
+    # unchanged so the remembered comment is only checked
+    asyncio.run(comment(["foo"]))
+    assert github.requests == [
+        ("GET", "/repos/foo/bar/commits/abc/pulls"),
+        ("GET", "/repos/foo/bar/issues/comments/4"),
+    ]
+    github.requests.clear()
+
+    # the remembered comment is edited without searching the comments
+    asyncio.run(comment(["bar"]))
+    assert github.requests == [
+        ("GET", "/repos/foo/bar/commits/abc/pulls"),
+        ("GET", "/repos/foo/bar/issues/comments/4"),
+        ("PATCH", "/repos/foo/bar/issues/comments/4"),
+    ]
+    github.requests.clear()
+
+    # a deleted comment is posted again
+    github.comments.pop()
+    asyncio.run(comment(["bar"]))
+    assert ("POST", "/repos/foo/bar/issues/2/comments") in github.requests
+    assert "bar" in github.comments[-1]["body"]
+
+
+def test_rate_limit(github):
+    github.rate_limited = 2
+
+    async def pulls():
+        async with AsyncRepo("foo/bar", "token", base_url=github.url) as repo:
+            repo.client.max_wait = 0.01
+            return await repo.pulls("abc")
+
+    pulls = asyncio.run(pulls())
+
+    # retried until the rate limit reset
+    assert len(pulls) == 1
+    assert len(github.requests) == 3
+
+
+def test_notifier(github):
+    async def notify():
+        async with AsyncRepo("foo/bar", "token", base_url=github.url) as repo:
+            (pull,) = await repo.pulls("abc")
+            await GitHubNotifier(pull).notify_async(iter([]))
+
+    asyncio.run(notify())
+
+    assert "No issues detected!" in github.comments[-1]["body"]
+    assert "Comparing abc (head) with base (base)" in github.comments[-1]["body"]
@@ -0,0 +1,62 @@
+import pytest
+
+from sqlcritic.normalize import normalize_sql
+
+
+@pytest.mark.parametrize(
+    "sql,expected",
+    [
+        (
+            "SELECT * FROM foo WHERE id = 1 AND name = 'bob'",
+            "SELECT * FROM foo WHERE id = %s AND name = %s",
+        ),
+        (
+            "SELECT * FROM foo WHERE id = $1 AND name = $2 LIMIT 10",
+            "SELECT * FROM foo WHERE id = %s AND name = %s LIMIT %s",
+        ),
+        (
+            "SELECT * FROM foo WHERE id IN (1, 2, 3)",
+            "SELECT * FROM foo WHERE id IN (%s)",
+        ),
+        (
+            "SELECT * FROM foo WHERE id in (%s,%s)",
+            "SELECT * FROM foo WHERE id IN (%s)",
+        ),
+        (
+            'SELECT "t0"."id" FROM "foo_2" "t0" WHERE "t0"."x" = \'it\'\'s\'',
+            'SELECT "t0"."id" FROM "foo_2" "t0" WHERE "t0"."x" = %s',
+        ),
+        ("SELECT * FROM table_1 WHERE x > 1.5e3", "SELECT * FROM table_1 WHERE x > %s"),
+        (
+            r"SELECT * FROM foo WHERE a = E'it\'s' AND b = e'a\\'",
+            "SELECT * FROM foo WHERE a = %s AND b = %s",
+        ),
+        (
+            "SELECT $$it's$$, $fn$ 1 $$ 2 $fn$ FROM foo WHERE id = $1",
+            "SELECT %s, %s FROM foo WHERE id = %s",
+        ),
+        (
+            "SELECT * FROM foo WHERE x > 1 AND created > now() - interval '1 day'",
+            "SELECT * FROM foo WHERE x > %s AND created > now() - interval '1 day'",
+        ),
+        (
+            "SELECT * FROM foo WHERE d = DATE '2023-01-01' AND "
+            "t < timestamp with time zone '2023-01-01 00:00'",
+            "SELECT * FROM foo WHERE d = DATE '2023-01-01' AND "
+            "t < timestamp with time zone '2023-01-01 00:00'",
+        ),
+        (
+            "SELECT x::numeric(10,2), CAST(y AS varchar(20)), z::character varying(3) "
+            "FROM foo WHERE round(x, 2) > 1",
+            "SELECT x::numeric(10,2), CAST(y AS varchar(20)), z::character varying(3) "
+            "FROM foo WHERE round(x, %s) > %s",
+        ),
+        (
+            "SELECT * FROM foo WHERE x > .5 AND y < -.25e2",
+            "SELECT * FROM foo WHERE x > %s AND y < -%s",
+        ),
+    ],
+)
+def test_normalize_sql(sql, expected):
+    assert normalize_sql(sql) == expected
+    assert normalize_sql(expected) == expected
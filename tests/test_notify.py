@@ -1,3 +1,5 @@
+import asyncio
+import threading
 from unittest.mock import PropertyMock
 
 from sqlcritic.analyze import AnalysisResult, AnalysisType
@@ -22,6 +24,7 @@ def test_github_notify(mocker):
                     ),
                 ]
             ),
+            extra={"count": 4},
         )
     ]
 
@@ -48,7 +51,7 @@ def test_github_notify(mocker):
             "```sql",
             "--- source query",
             results[0].queries[0],
-            "--- N query",
+            "--- N query (executed 4 times)",
             results[0].queries[1],
             "```",
             "<details>",
@@ -90,3 +93,20 @@ def test_github_notify_empty(mocker):
             "*Comment made by [sql-critic](https://github.com/scttnlsn/sql-critic)*",
         ]
     )
+
+
+def test_github_notify_async_sync_pull(mocker):
+    threads = []
+    comment = mocker.patch(
+        "sqlcritic.github.Pull.comment",
+        side_effect=lambda lines: threads.append(threading.current_thread()),
+    )
+    mocker.patch("sqlcritic.github.Pull.base_sha", new_callable=PropertyMock)
+    mocker.patch("sqlcritic.github.Pull.head_sha", new_callable=PropertyMock)
+
+    notifier = GitHubNotifier(Pull(None, 123))
+    asyncio.run(notifier.notify_async(iter([])))
+
+    comment.assert_called_once()
+    # the blocking client isn't run on the event loop's thread
+    assert threads != [threading.main_thread()]
@@ -0,0 +1,55 @@
+from sqlcritic import parsing
+from sqlcritic.parsing import ParsedQuery, QueryCache, parse_query
+
+sql = 'SELECT "demo_entry"."id" FROM "demo_entry" e INNER JOIN "demo_author" a ON e."author_id" = a."id" WHERE e."published_at" > %s AND a."name" = %s'
+
+
+def test_parse_query():
+    assert parse_query(sql) == ParsedQuery(
+        table_aliases={"e": "demo_entry", "a": "demo_author"},
+        where_columns=[{"demo_entry": ["published_at"], "demo_author": ["name"]}],
+    )
+
+
+def test_query_cache(mocker):
+    parse = mocker.spy(parsing, "parse_query")
+    cache = QueryCache(maxsize=2)
+
+    assert cache.get(sql) == parse_query(sql)
+    assert cache.get(sql) is cache.get(sql)
+    assert parse.call_count == 1
+
+    cache.get("SELECT * FROM foo")
+    cache.get("SELECT * FROM bar")
+    # the first statement was evicted
+    cache.get(sql)
+    assert parse.call_count == 4
+
+    cache.clear()
+    cache.get(sql)
+    assert parse.call_count == 5
+
+
+def test_query_cache_normalized(mocker):
+    parse = mocker.spy(parsing, "parse_query")
+    cache = QueryCache()
+
+    first = cache.get("SELECT * FROM foo WHERE foo.id = 1 AND foo.name = 'a'")
+    second = cache.get("SELECT * FROM foo WHERE foo.id = 2 AND foo.name = 'b'")
+    assert first is second
+    assert parse.call_count == 1
+    assert first.where_columns == [{"foo": ["id", "name"]}]
+
+
+def test_query_cache_persisted(tmp_path, mocker):
+    cache = QueryCache()
+    cache.open(str(tmp_path))
+    expected = cache.get(sql)
+    cache.save()
+
+    parse = mocker.spy(parsing, "parse_query")
+    cache = QueryCache()
+    cache.open(str(tmp_path))
+
+    assert cache.get(sql) == expected
+    assert parse.call_count == 0
@@ -0,0 +1,92 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from sqlcritic.analyze import analyze
+from sqlcritic.profiling import Profiler
+
+
+def test_stage():
+    profiler = Profiler()
+    with profiler.stage("disabled"):
+        pass
+    assert profiler.stages == {}
+
+    profiler.enable()
+    for _ in range(2):
+        with profiler.stage("parse", count=10) as stage:
+            stage.count += 5
+
+    stats = profiler.stages["parse"]
+    assert stats.calls == 2
+    assert stats.count == 30
+    assert stats.wall >= 0
+
+
+def test_stage_cpu():
+    profiler = Profiler()
+    profiler.enable()
+
+    with profiler.stage("children"):
+        # CPU time of finished child processes is included
+        subprocess.run([sys.executable, "-c", "sum(range(10**7))"], check=True)
+    assert profiler.stages["children"].cpu > 0.05
+
+
+@pytest.mark.skipif(
+    sys.platform != "linux", reason="the current RSS is read from /proc"
+)
+def test_stage_memory():
+    profiler = Profiler()
+    profiler.enable()
+
+    with profiler.stage("allocate"):
+        data = b"x" * (64 * 1024 * 1024)
+    assert profiler.stages["allocate"].rss_delta > 32 * 1024 * 1024
+
+    with profiler.stage("release"):
+        del data
+    assert profiler.stages["release"].rss_delta < 0
+
+
+def test_analyzer_stages(spans, metadata, mocker):
+    profiler = Profiler()
+    profiler.enable()
+    mocker.patch("sqlcritic.analyze.profiler", profiler)
+
+    list(analyze(spans, metadata=metadata))
+
+    assert set(profiler.stages) == set(
+        [
+            "analyze.NPlusOneAnalyzer",
+            "analyze.MissingIndexAnalyzer",
+            "analyze.SeqScanAnalyzer",
+        ]
+    )
+    # the count is the number of spans each analyzer visited
+    assert profiler.stages["analyze.SeqScanAnalyzer"].count == len(
+        [span for span in spans if span.sql is not None]
+    )
+
+
+def test_report(tmp_path, monkeypatch, capsys):
+    summary_path = tmp_path / "summary.md"
+    monkeypatch.setenv("GITHUB_STEP_SUMMARY", str(summary_path))
+
+    profiler = Profiler()
+    profiler.enable()
+    profiler.start_dump("cprofile")
+    with profiler.stage("explain", count=3):
+        pass
+    profiler.stop_dump(str(tmp_path))
+    profiler.report(str(tmp_path))
+
+    assert "::debug::stage=explain" in capsys.readouterr().out
+    assert "| explain |" in summary_path.read_text()
+    assert (tmp_path / "sqlcritic.prof").exists()
+
+    data = json.loads((tmp_path / "sqlcritic-profile.json").read_text())
+    assert [stats["name"] for stats in data["stages"]] == ["explain"]
+    assert data["stages"][0]["count"] == 3
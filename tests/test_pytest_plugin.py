@@ -0,0 +1,141 @@
+import subprocess
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+from sqlcritic.pytest_plugin import SQLCriticController
+from sqlcritic.trace import SpanType, parse_spans
+from sqlcritic.utils import load_data
+
+TESTS = """
+import pytest
+
+
+from opentelemetry import trace
+
+
+@pytest.fixture
+def tracer(request):
+    plugin = request.config.pluginmanager.get_plugin("sqlcritic-collector")
+    if plugin is None:
+        return trace.get_tracer(__name__)
+    return plugin.collector.tracer
+
+
+def query(tracer, sql):
+    with tracer.start_as_current_span("SELECT") as span:
+        span.set_attribute("db.statement", sql)
+
+
+def test_one(tracer):
+    with tracer.start_as_current_span("request"):
+        for i in range(3):
+            query(tracer, f"select * from foo where id = {i}")
+
+
+def test_two(tracer):
+    query(tracer, "select * from bar")
+"""
+
+
+@pytest.fixture
+def run(pytester):
+    pytester.makepyfile(test_example=TESTS)
+
+    def run(*args):
+        # the plugin is loaded through its pytest11 entry point
+        result = pytester.runpytest_inprocess(*args)
+        result.assert_outcomes(passed=2)
+        return result
+
+    return run
+
+
+def db_spans(path):
+    spans = parse_spans(load_data(str(path)))
+    return [
+        (spans.test_for(span).name, span.sql)
+        for span in spans
+        if span.span_type == SpanType.DB
+    ]
+
+
+def test_plugin(pytester, run):
+    result = run("--sqlcritic-output", "results.json")
+
+    assert db_spans(pytester.path / "results.json") == [
+        ("test_one", "select * from foo where id = 0"),
+        ("test_one", "select * from foo where id = 1"),
+        ("test_one", "select * from foo where id = 2"),
+        ("test_two", "select * from bar"),
+    ]
+    spans = parse_spans(load_data(str(pytester.path / "results.json")))
+    assert {span.test.path for span in spans if span.test} == {"test_example.py"}
+
+    result.stdout.fnmatch_lines(
+        ["*- sql-critic -*", "traced 2 tests (7 spans) in *s (*ms per test)"]
+    )
+
+
+def test_plugin_disabled(pytester, run):
+    result = run()
+
+    assert "sql-critic" not in result.stdout.str()
+    assert not (pytester.path / "results.json").exists()
+
+
+def test_plugin_options(pytester, run):
+    run(
+        "--sqlcritic-output",
+        "results.json",
+        "--sqlcritic-stream",
+        "--sqlcritic-compact",
+        "--sqlcritic-sharded",
+        "--sqlcritic-normalize",
+        "--sqlcritic-db-and-tests-only",
+        "--sqlcritic-max-repeats",
+        "2",
+    )
+
+    assert sorted(path.name for path in pytester.path.glob("results*")) == [
+        "results.main.json"
+    ]
+    assert db_spans(pytester.path / "results.main.json") == [
+        ("test_one", "select * from foo where id = %s"),
+        ("test_one", "select * from foo where id = %s"),
+        ("test_two", "select * from bar"),
+    ]
+
+
+def test_plugin_stream_requires_ndjson(pytester):
+    result = pytester.runpytest_inprocess(
+        "--sqlcritic-output", "out.json", "--sqlcritic-stream"
+    )
+    result.stderr.fnmatch_lines(["*--sqlcritic-stream requires*"])
+
+
+def test_plugin_imports():
+    # the plugin is loaded by every pytest run so it mustn't import the analyzers
+    # (or their dependencies)
+    code = (
+        "import sys, sqlcritic.pytest_plugin; print('sqlcritic.analyze' in sys.modules)"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.strip() == "False"
+
+
+def test_controller_summary():
+    controller = SQLCriticController()
+    for i in range(2):
+        node = MagicMock()
+        node.workeroutput = {"sqlcritic": {"tests": 2, "spans": 5, "seconds": 0.5}}
+        controller.pytest_testnodedown(node, None)
+    # a worker that didn't collect anything
+    controller.pytest_testnodedown(MagicMock(workeroutput={}), None)
+
+    terminalreporter = MagicMock()
+    controller.pytest_terminal_summary(terminalreporter)
+    terminalreporter.write_line.assert_called_once_with(
+        "traced 4 tests (10 spans) across 2 workers in 1.000s (250.000ms per test)"
+    )
@@ -0,0 +1,79 @@
+import json
+
+from sqlcritic.collector import Collector
+from sqlcritic.compact import compact
+from sqlcritic.shards import merge_shards, shard_path, write_merged
+from sqlcritic.trace import SpanType, parse_spans
+from sqlcritic.utils import load_data, parse_timestamp
+
+
+def collect(worker, tmp_path, monkeypatch, tests):
+    monkeypatch.setenv("PYTEST_XDIST_WORKER", worker)
+    collector = Collector(stream_path=str(tmp_path / "stream.ndjson"), sharded=True)
+    for test in tests:
+        with collector.trace_test("example.py", test, f"test_{test}"):
+            with collector.tracer.start_as_current_span("SELECT") as span:
+                span.set_attribute("db.statement", f"select * from foo_{test};")
+    collector.save_results(str(tmp_path / "results.ndjson"))
+
+
+def test_shard_path(monkeypatch):
+    monkeypatch.delenv("PYTEST_XDIST_WORKER", raising=False)
+    assert shard_path("out/results.ndjson") == "out/results.main.ndjson"
+    monkeypatch.setenv("PYTEST_XDIST_WORKER", "gw3")
+    assert shard_path("out/results.ndjson") == "out/results.gw3.ndjson"
+    assert shard_path("results", worker="gw1") == "results.gw1"
+
+
+def test_merge(tmp_path, monkeypatch):
+    # each worker writes its own shard
+    collect("gw0", tmp_path, monkeypatch, [1, 3])
+    collect("gw1", tmp_path, monkeypatch, [2, 4])
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "results.gw0.ndjson",
+        "results.gw1.ndjson",
+    ]
+
+    paths = [str(tmp_path / f"results.gw{i}.ndjson") for i in range(2)]
+    merged = list(merge_shards(paths))
+    end_times = [parse_timestamp(span["end_time"]) for span in merged]
+    assert end_times == sorted(end_times)
+    assert len(merged) == 8
+
+    output_path = tmp_path / "results.ndjson"
+    assert write_merged(paths, str(output_path)) == 8
+
+    # every query is still attributed to its test
+    for data in [load_data(str(output_path)), load_data(str(tmp_path / "*.gw*"))]:
+        spans = parse_spans(data)
+        db_spans = [span for span in spans if span.span_type == SpanType.DB]
+        assert sorted((spans.test_for(span).line, span.sql) for span in db_spans) == [
+            (test, f"select * from foo_{test};") for test in range(1, 5)
+        ]
+
+
+def test_merge_json(tmp_path, monkeypatch):
+    collect("gw0", tmp_path, monkeypatch, [1])
+    collect("gw1", tmp_path, monkeypatch, [2])
+
+    # written as a JSON array (readable by `load_data`) rather than NDJSON
+    output_path = tmp_path / "results.json"
+    assert write_merged(sorted(map(str, tmp_path.iterdir())), str(output_path)) == 4
+    data = json.loads(output_path.read_text())
+    assert load_data(str(output_path)) == data
+    assert len(data) == 4
+
+
+def test_merge_compact(tmp_path):
+    data = load_data("tests/fixtures/test-spans.json")
+    shard = tmp_path / "results.gw0.json"
+    shard.write_text(json.dumps(compact(data)))
+
+    output_path = tmp_path / "results.json"
+    write_merged([str(shard)], str(output_path), compact=True)
+
+    spans = parse_spans(load_data(str(output_path)))
+    expected = parse_spans(data)
+    assert [(span.span_id, span.parent_id, span.sql, span.test) for span in spans] == [
+        (span.span_id, span.parent_id, span.sql, span.test) for span in expected
+    ]
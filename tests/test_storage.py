@@ -1,29 +1,174 @@
-from sqlcritic.storage import Storage
+import gzip
+import json
+import os
+import random
 
-# need to temporarily paste a real key + secret here if you want to update the cassettes
-access_key_id = "test"
-secret_access_key = "test"
+import boto3
+import pytest
+from moto import mock_aws
 
+from sqlcritic.storage import (
+    CachedStorage,
+    CompressedJSONStream,
+    LocalStorage,
+    S3Storage,
+)
 
-def test_put_get(vcr_cassette):
-    storage = Storage(
-        access_key_id=access_key_id,
-        secret_access_key=secret_access_key,
-        bucket="sql-critic-demo",
+bucket = "sql-critic-demo"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        s3 = boto3.resource(
+            "s3", aws_access_key_id="test", aws_secret_access_key="test"
+        )
+        s3.create_bucket(Bucket=bucket)
+        yield s3
+
+
+@pytest.fixture
+def storage(s3):
+    return S3Storage(
+        access_key_id="test",
+        secret_access_key="test",
+        bucket=bucket,
     )
 
+
+def test_put_get(storage, s3):
     storage.put("testing", {"foo": "bar"})
 
     result = storage.get("testing")
     assert result == {"foo": "bar"}
 
+    body = s3.Object(bucket, "testing.json.gz").get()["Body"].read()
+    assert json.loads(gzip.decompress(body)) == {"foo": "bar"}
 
-def test_get_missing(vcr_cassette):
-    storage = Storage(
-        access_key_id=access_key_id,
-        secret_access_key=secret_access_key,
-        bucket="sql-critic-demo",
+
+def test_put_get_list(storage, s3):
+    data = [{"name": "SELECT", "attributes": {"db.statement": "SELECT 1"}}] * 3
+    storage.put("spans", data)
+
+    assert storage.get("spans") == data
+
+
+def test_put_get_multipart(s3):
+    storage = S3Storage(
+        access_key_id="test",
+        secret_access_key="test",
+        bucket=bucket,
+        # the smallest part size S3 allows
+        part_size=5 * 1024 * 1024,
     )
 
+    # random values so that the compressed data (~6 MiB) spans multiple parts
+    rng = random.Random(0)
+    data = [{"id": "%032x" % rng.getrandbits(128)} for _ in range(300_000)]
+    storage.put("large", data)
+
+    etag = s3.Object(bucket, "large.json.gz").e_tag
+    assert etag.strip('"').endswith("-2")
+    assert storage.get("large") == data
+
+
+def test_get_legacy(storage, s3):
+    # uncompressed objects written by earlier versions can still be read
+    s3.Object(bucket, "legacy.json").put(Body=json.dumps({"foo": "bar"}))
+
+    assert storage.get("legacy") == {"foo": "bar"}
+
+
+def test_get_missing(storage):
     result = storage.get("missing-key")
     assert result is None
+
+
+def test_compressed_json_stream():
+    data = {"values": list(range(10_000))}
+    stream = CompressedJSONStream(data, "json", chunk_size=100)
+
+    parts = []
+    while True:
+        part = stream.read(1000)
+        if not part:
+            break
+        parts.append(part)
+
+    # reads are only short at the end of the stream
+    assert all(len(part) == 1000 for part in parts[:-1])
+    assert json.loads(gzip.decompress(b"".join(parts))) == data
+
+
+def test_local_storage(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+
+    storage.put("sha/spans", [{"foo": "bar"}])
+    storage.put("sha/metadata", {"foo": "bar"})
+
+    assert storage.get("sha/spans") == [{"foo": "bar"}]
+    assert storage.get("sha/metadata") == {"foo": "bar"}
+    assert storage.get("missing") is None
+
+    # replacing with a different type of value
+    storage.put("sha/spans", {"foo": "bar"})
+    assert storage.get("sha/spans") == {"foo": "bar"}
+
+
+def test_cached_storage(storage, tmp_path, mocker):
+    storage.put("base/spans", [{"foo": "bar"}])
+    cached = CachedStorage(storage, str(tmp_path), max_size=1024 * 1024)
+    get = mocker.spy(storage, "get")
+
+    assert cached.get("base/spans") == [{"foo": "bar"}]
+    assert cached.get("base/spans") == [{"foo": "bar"}]
+    assert cached.get("missing") is None
+    assert (cached.hits, cached.misses) == (1, 2)
+    assert get.call_count == 2
+
+    # written through to both
+    cached.put("head/spans", [{"foo": "baz"}])
+    assert storage.get("head/spans") == [{"foo": "baz"}]
+    assert cached.get("head/spans") == [{"foo": "baz"}]
+    assert cached.hits == 2
+
+
+def test_cached_storage_uncached_prefixes(tmp_path):
+    backend = LocalStorage(str(tmp_path / "backend"))
+    cached = CachedStorage(
+        backend,
+        str(tmp_path / "cache"),
+        max_size=1024 * 1024,
+        uncached_prefixes=["explain-cache/"],
+    )
+
+    cached.put("explain-cache/abc", {"run": 1})
+    # rewritten by another run
+    backend.put("explain-cache/abc", {"run": 2})
+
+    assert cached.get("explain-cache/abc") == {"run": 2}
+    assert cached.cache.files() == []
+    assert (cached.hits, cached.misses) == (0, 0)
+
+
+def test_cached_storage_eviction(tmp_path):
+    backend = LocalStorage(str(tmp_path / "backend"))
+    cached = CachedStorage(backend, str(tmp_path / "cache"), max_size=0)
+
+    rng = random.Random(0)
+    for key in ["a", "b", "c"]:
+        backend.put(key, ["%032x" % rng.getrandbits(128) for _ in range(20)])
+    size = os.path.getsize(backend._path("a", "ndjson"))
+    # room for two of the files
+    cached.max_size = size * 2 + size // 2
+
+    cached.get("a")
+    cached.get("b")
+    # reading "a" again makes "b" the least recently used
+    os.utime(cached.cache._path("b", "ndjson"), (1, 1))
+    os.utime(cached.cache._path("a", "ndjson"), (1, 1))
+    cached.get("a")
+    cached.get("c")
+
+    assert sorted(os.listdir(tmp_path / "cache")) == ["a.ndjson.gz", "c.ndjson.gz"]
@@ -0,0 +1,70 @@
+from sqlcritic.trace import Spans, SpanType, Test, parse_spans
+from sqlcritic.utils import load_data
+
+
+def test_parse_spans(spans):
+    db_spans = [span for span in spans if span.span_type == SpanType.DB]
+    test_spans = [span for span in spans if span.span_type == SpanType.TEST]
+
+    assert all(span.sql is not None and span.test is None for span in db_spans)
+    assert [span.test for span in test_spans] == [
+        Test(path="tests/test_entries.py", line=9, name="test_entries"),
+        Test(path="tests/test_entries.py", line=30, name="test_entries_other"),
+    ]
+
+    start_times = [span.start_time for span in spans]
+    assert start_times == sorted(start_times)
+
+
+def test_parse_spans_shared_values(spans):
+    # spans are slotted and repeated values are shared between them
+    span = next(iter(spans))
+    assert not hasattr(span, "__dict__")
+
+    by_sql = {}
+    for span in spans:
+        if span.sql is not None:
+            assert by_sql.setdefault(span.sql, span.sql) is span.sql
+        if span.parent_id is not None:
+            assert spans.parent_span(span).span_id is span.parent_id
+
+
+def test_parse_spans_duplicates():
+    data = load_data("tests/fixtures/test-spans.json")
+    spans = parse_spans(data + data[:10])
+
+    assert len(spans) == len(data)
+    assert len(list(spans)) == len(data)
+
+
+def test_test_for(make_span):
+    test = Test(path="tests/test_example.py", line=1, name="test_example")
+    spans = Spans(
+        [
+            make_span("root", None, 0),
+            make_span("query-outside-test", "root", 1, sql="SELECT 1"),
+            make_span("test", None, 2, test=test),
+            make_span("intermediate", "test", 3),
+            make_span("query", "intermediate", 4, sql="SELECT 1"),
+            # recorded with an earlier start time than its parent
+            make_span("early-query", "late-intermediate", 5, sql="SELECT 1"),
+            make_span("late-intermediate", "test", 6),
+        ]
+    )
+
+    owners = {span.span_id: spans.test_for(span) for span in spans}
+    assert owners == {
+        "root": None,
+        "query-outside-test": None,
+        "test": None,
+        "intermediate": test,
+        "query": test,
+        "early-query": test,
+        "late-intermediate": test,
+    }
+    assert [span.span_id for span in spans if spans.descends_from_test(span)] == [
+        "intermediate",
+        "query",
+        "early-query",
+        "late-intermediate",
+    ]
@@ -0,0 +1,17 @@
+from sqlcritic.utils import load_data, parse_timestamp
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("1970-01-01T00:00:00.000000Z") == 0
+    assert parse_timestamp("2023-08-21T18:20:34.214080Z") == 1692642034214080000
+    assert parse_timestamp("2023-08-21T18:20:34.214080+00:00") == 1692642034214080000
+    assert parse_timestamp("2023-08-21T20:20:34.214080+02:00") == 1692642034214080000
+    assert parse_timestamp("2023-08-21T18:20:34") == 1692642034000000000
+
+
+def test_parse_timestamp_order():
+    data = load_data("tests/fixtures/test-spans.json")
+    timestamps = [item["start_time"] for item in data]
+
+    # the fixed ISO format sorts lexicographically in time order
+    assert sorted(timestamps, key=parse_timestamp) == sorted(timestamps)